@@ -1,35 +1,191 @@
 import streamlit as st
-import preprocessor, helper
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import helper, report, incremental, query, profiling, jobs, store, cache, snapshot
 from helper import *
 from preprocessor import get_date_range
+from io import BytesIO
 import pandas as pd
 
 st.sidebar.title("Whatsapp chat analyzer")
 
+SECTION_MEMO_SIZE = 512
+
+# seconds between polls of a running background job
+POLL_SECONDS = 0.5
+
+
+# progress of a background job; the fragment polls on its own and reruns
+# the whole page once the job has finished
+@st.fragment(run_every=POLL_SECONDS)
+def job_progress(job_id):
+    job = jobs.get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    st.progress(job.progress, text=f"{job.name}: {job.message or job.status}")
+    if st.button("Cancel", key=f"cancel-{job_id}"):
+        jobs.cancel(job_id)
+        st.rerun()
+
+# jobs whose progress this render already shows
+shown_jobs = set()
+
+# result of func run as a background job under key; None while it runs,
+# with its progress shown instead (once per render, sections may share a
+# job), or when it failed or was cancelled
+def background(key, name, func, *args, **kwargs):
+    job = jobs.submit(key, name, func, *args, **kwargs)
+    if not job.done:
+        if job.id not in shown_jobs:
+            shown_jobs.add(job.id)
+            job_progress(job.id)
+        return None
+    if job.status == 'done':
+        prof.add(name, job.seconds)
+        return job.result
+
+    if job.status == 'failed':
+        st.error(f"{name} failed")
+        with st.expander("Details"):
+            st.code(job.error)
+    else:
+        st.warning(f"{name} was cancelled")
+    if st.button("Retry", key=f"retry-{job.id}"):
+        jobs.forget(key)
+        st.rerun()
+    return None
+
+# parse an upload unless another session already holds the same export;
+# returns the content hash the chat is shared under. A snapshot is opened
+# as is, under a key of its own so it never stands in for a parsed export.
+def load_shared(source, viewer):
+    key = cache.content_hash(source)
+    if snapshot.is_snapshot(source):
+        key = 'snapshot-' + key
+        if store.get(key) is None:
+            store.put(key, snapshot.open_snapshot(source, key), viewer)
+        return key
+
+    if store.get(key) is None:
+        key, df, aggregates = incremental.load_chat(source)
+        persist = incremental.polarity_saver(source, key)
+        store.put(key, query.Chat(df, aggregates, key, persist), viewer)
+    return key
+
+def build_report(q, quality, progress=None, pool=None):
+    timings = {}
+    pdf_buffer = helper.generate_complete_pdf_report(q, quality=quality, timings=timings,
+                                                     progress=progress, pool=pool)
+    return pdf_buffer.getvalue(), timings
+
+# a timeline frame (date, message, label) as an interactive Plotly chart
+def plot_timeline(frame, color, x='date'):
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Scatter(
+        x=frame[x], y=frame['message'], mode='lines', line={'color': color},
+        customdata=frame['label'], hovertemplate="%{customdata}: %{y} messages<extra></extra>"))
+    fig.update_layout(margin={'l': 0, 'r': 0, 't': 10, 'b': 0}, yaxis_title="Messages")
+    return fig
+
+def build_snapshot(chat):
+    buffer = BytesIO()
+    snapshot.write_snapshot(chat, buffer)
+    return buffer.getvalue()
+
 uploaded_file = st.sidebar.file_uploader("Choose a file")
+
+# time every stage of this render; memory is traced only while a panel is
+# open in some session
+session_id = get_script_run_ctx().session_id
+show_performance = st.sidebar.checkbox("Show performance panel")
+profiling.trace_memory(session_id, show_performance)
+prof = profiling.Profiler()
+
 if uploaded_file is not None:
-    bytes_data = uploaded_file.getvalue()
-    data = bytes_data.decode("utf-8")
-    df = preprocessor.preprocess(data)
+    # reuse the parsed frame and aggregates of an export seen before; a newer
+    # export of a known chat only parses and aggregates its new messages.
+    # Loading runs as a background job. The chat lives in the process-wide
+    # store, shared with every session viewing the same export; the session
+    # only keeps its key.
+    viewer = session_id
+    if st.session_state.get('upload_id') != uploaded_file.file_id:
+        load_key = ('load', uploaded_file.file_id)
+        loaded = background(load_key, 'load_chat', load_shared, uploaded_file, viewer)
+        if loaded is None:
+            st.stop()
+        jobs.forget(load_key)
+        previous = st.session_state.get('chat_key')
+        if previous is not None and previous != loaded:
+            store.release(previous, viewer)
+        st.session_state['chat_key'] = loaded
+        st.session_state['upload_id'] = uploaded_file.file_id
+
+    chat_key = st.session_state['chat_key']
+    chat = store.acquire(chat_key, viewer)
+    if chat is None:
+        # evicted while this session was away, load it again
+        del st.session_state['upload_id']
+        st.rerun()
 
     # date range filter
-    min_date = df['only_date'].min()
-    max_date = df['only_date'].max()
+    min_date = chat.min_date
+    max_date = chat.max_date
 
     start_date, end_date = st.sidebar.date_input("Select date range",[min_date, max_date],min_value=min_date,max_value=max_date)
 
-    df = df[(df['only_date'] >= start_date) & (df['only_date'] <= end_date)]
-
     # fetch unique users
-    user_list = df['user'].unique().tolist()
-    user_list.remove('group_notification')
+    user_list = chat.query(start=start_date, end=end_date).users()
+    if 'group_notification' in user_list:
+        user_list.remove('group_notification')
     user_list.sort()
     user_list.insert(0, "Overall")
     selected_user = st.sidebar.selectbox("Show analysis wrt", user_list)
 
-    if st.sidebar.button("Show analysis"):
+    # a conversation ends after this many minutes of silence
+    gap_minutes = st.sidebar.number_input("Conversation gap (minutes)", min_value=1, max_value=1440, value=60)
+    gap = pd.Timedelta(minutes=gap_minutes)
 
-        num_messages, words, num_media_msg, num_links = helper.fetch_stats(selected_user,df)
+    # the selected user over the selected dates; every section below reads
+    # its rows, cube slice, terms and emoji through it
+    q = chat.query(selected_user, start_date, end_date)
+
+    # a snapshot keeps word and emoji counts and personality tags for the
+    # whole chat only, and no conversations
+    whole_chat_only = not chat.has_rows and not q.full_range
+
+    # keep the analysis open across the reruns triggered by widgets below it
+    if st.sidebar.button("Show analysis"):
+        st.session_state['show_analysis'] = True
+
+    if st.session_state.get('show_analysis'):
+        # plotting libraries load only once there is something to plot, so
+        # the upload screen comes up with streamlit and pandas alone
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
+        # helper results per (chat, user, date range), kept across reruns so
+        # toggling a section or coming back to a range does not recompute
+        memo = st.session_state.setdefault('sections', {})
+        if len(memo) > SECTION_MEMO_SIZE:
+            memo.clear()
+
+        def section(name, func):
+            key = (chat_key, selected_user, q.date_range(), name)
+            if key not in memo:
+                memo[key] = prof.call(name, func, q)
+            return memo[key]
+
+        # heavy sections run as background jobs shared by every session
+        # looking at the same chat, user and range; None until finished
+        def heavy_section(name, func, **kwargs):
+            key = (chat_key, selected_user, q.date_range(), name)
+            if key not in memo:
+                result = background(key, name, func, q, **kwargs)
+                if result is None:
+                    return None
+                memo[key] = result
+            return memo[key]
+
+        num_messages, words, num_media_msg, num_links = section('fetch_stats', helper.fetch_stats)
         st.title("Top statistics")
         col1, col2, col3, col4 = st.columns(4)
 
@@ -47,153 +203,227 @@ if uploaded_file is not None:
             st.title(num_links)
 
         # average message length
-        avg_len = helper.avg_message_length(selected_user, df)
+        avg_len = section('avg_message_length', helper.avg_message_length)
         st.subheader("Average Message Length")
         st.write(f"{avg_len} characters")
 
+        # everything below the top statistics is computed only once its
+        # section is switched on, then reused for this chat, user and range
+
         #monthly timeline
-        st.title("Monthly Timeline")
-        timeline = helper.monthly_timeline(selected_user,df)
-        fig,ax = plt.subplots()
-        ax.plot(timeline['time'], timeline['message'])
-        plt.xticks(rotation='vertical')
-        st.pyplot(fig)
+        if st.toggle("Monthly Timeline"):
+            st.title("Monthly Timeline")
+            timeline = section('monthly_timeline', helper.monthly_timeline)
+            fig = plot_timeline(timeline.assign(label=timeline['time']), None, x='time')
+            prof.call('figure: monthly timeline', st.plotly_chart, fig)
 
         #daily timeline
-        st.title("Daily Timeline")
-        daily_timeline = helper.daily_timeline(selected_user, df)
-        fig, ax = plt.subplots()
-        ax.plot(daily_timeline['only_date'], daily_timeline['message'], color='green')
-        plt.xticks(rotation='vertical')
-        st.pyplot(fig)
+        if st.toggle("Daily Timeline"):
+            st.title("Daily Timeline")
+            # long chats are summed per week or month, and downsampled
+            # keeping peaks, so the browser only gets what fits the chart
+            resolution = st.radio("Resolution", ['auto', 'day', 'week', 'month'], horizontal=True)
+            daily_timeline, shown = section(f'timeline/{resolution}',
+                                            lambda q: helper.timeline(q, resolution=resolution))
+            st.caption(f"Messages per {shown}, {len(daily_timeline)} points")
+            fig = plot_timeline(daily_timeline, 'green')
+            prof.call('figure: daily timeline', st.plotly_chart, fig)
 
         #activity map
-        st.title("Activity map")
-        col1,col2 = st.columns(2)
+        if st.toggle("Activity map"):
+            st.title("Activity map")
+            col1,col2 = st.columns(2)
 
-        with col1:
-            st.header("Most busy day")
-            busy_day = helper.week_activity_map(selected_user, df)
-            fig, ax = plt.subplots()
-            ax.bar(busy_day.index, busy_day.values, color='pink')
-            plt.xticks(rotation='vertical')
-            st.pyplot(fig)
+            with col1:
+                st.header("Most busy day")
+                busy_day = section('week_activity_map', helper.week_activity_map)
+                fig, ax = plt.subplots()
+                ax.bar(busy_day.index, busy_day.values, color='pink')
+                plt.xticks(rotation='vertical')
+                prof.call('figure: busy day', st.pyplot, fig)
 
-        with col2:
-            st.header("Most busy month")
-            busy_month = helper.month_activity_map(selected_user, df)
-            fig, ax = plt.subplots()
-            ax.bar(busy_month.index, busy_month.values, color='purple')
-            plt.xticks(rotation='vertical')
-            st.pyplot(fig)
+            with col2:
+                st.header("Most busy month")
+                busy_month = section('month_activity_map', helper.month_activity_map)
+                fig, ax = plt.subplots()
+                ax.bar(busy_month.index, busy_month.values, color='purple')
+                plt.xticks(rotation='vertical')
+                prof.call('figure: busy month', st.pyplot, fig)
 
-        st.title("Weekly activity map")
-        user_heatmap = helper.activity_heatmap(selected_user, df)
-        fig, ax = plt.subplots()
-        ax = sns.heatmap(user_heatmap, cmap='YlGnBu')
-        st.pyplot(fig)
+        if st.toggle("Weekly activity map"):
+            st.title("Weekly activity map")
+            user_heatmap = section('activity_heatmap', helper.activity_heatmap)
+            fig, ax = plt.subplots()
+            ax = sns.heatmap(user_heatmap, cmap='YlGnBu')
+            prof.call('figure: weekly heatmap', st.pyplot, fig)
 
         # most active hour
-        st.title("Most Active Hours")
-        active_hour = helper.most_active_hour(selected_user, df)
+        if st.toggle("Most Active Hours"):
+            st.title("Most Active Hours")
+            active_hour = section('most_active_hour', helper.most_active_hour)
 
-        fig, ax = plt.subplots()
-        ax.bar(active_hour.index, active_hour.values)
-        ax.set_xlabel("Hour of Day")
-        ax.set_ylabel("Number of Messages")
-        st.pyplot(fig)
+            fig, ax = plt.subplots()
+            ax.bar(active_hour.index, active_hour.values)
+            ax.set_xlabel("Hour of Day")
+            ax.set_ylabel("Number of Messages")
+            prof.call('figure: active hours', st.pyplot, fig)
 
         #finding the busiest users in the group
-        if selected_user == 'Overall':
+        if selected_user == 'Overall' and st.toggle("Most busy users"):
             st.title('Most busy users')
-            x,new_df = helper.most_busy_users(df)
+            x,new_df = section('most_busy_users', helper.most_busy_users)
             fig, ax = plt.subplots()
             col1, col2 = st.columns(2)
 
             with col1:
                 ax.bar(x.index, x.values, color='red')
                 plt.xticks(rotation='vertical')
-                st.pyplot(fig)
+                prof.call('figure: busy users', st.pyplot, fig)
             with col2:
                 st.dataframe(new_df)
 
         #wordcloud
-        st.title("Wordcloud")
-        df_wc = helper.create_wordcloud(selected_user, df)
-        fig, ax = plt.subplots()
-        ax.imshow(df_wc)
-        st.pyplot(fig)
+        if st.toggle("Wordcloud"):
+            st.title("Wordcloud")
+            if whole_chat_only:
+                st.caption(helper.WHOLE_CHAT_NOTE)
+            df_wc = heavy_section('create_wordcloud', helper.create_wordcloud)
+            if df_wc is not None:
+                fig, ax = plt.subplots()
+                ax.imshow(df_wc)
+                prof.call('figure: wordcloud', st.pyplot, fig)
 
         #most common words
-        most_common_df = helper.most_common_words(selected_user, df)
+        if st.toggle("Most common words"):
+            most_common_df = section('most_common_words', helper.most_common_words)
 
-        fig, ax = plt.subplots()
-        ax.barh(most_common_df[0],most_common_df[1],color='orange')
-        plt.xticks(rotation='vertical')
+            fig, ax = plt.subplots()
+            ax.barh(most_common_df[0],most_common_df[1],color='orange')
+            plt.xticks(rotation='vertical')
 
-        st.title("Most common words")
-        st.pyplot(fig)
+            st.title("Most common words")
+            if whole_chat_only:
+                st.caption(helper.WHOLE_CHAT_NOTE)
+            prof.call('figure: common words', st.pyplot, fig)
 
         #emoji analysis
-        emoji_df = helper.emoji_helper(selected_user, df)
-        st.title("Emoji Analysis")
+        if st.toggle("Emoji Analysis"):
+            emoji_df = section('emoji_helper', helper.emoji_helper)
+            st.title("Emoji Analysis")
+            if whole_chat_only:
+                st.caption(helper.WHOLE_CHAT_NOTE)
 
-        col1, col2 = st.columns(2)
+            col1, col2 = st.columns(2)
 
-        with col1:
-            st.dataframe(emoji_df)
-        with col2:
-            fig, ax = plt.subplots()
-            ax.pie(emoji_df[1].head(), labels=emoji_df[0].head(), autopct="%0.2f")
-            st.pyplot(fig)
+            with col1:
+                st.dataframe(emoji_df)
+            with col2:
+                fig, ax = plt.subplots()
+                ax.pie(emoji_df[1].head(), labels=emoji_df[0].head(), autopct="%0.2f")
+                prof.call('figure: emoji pie', st.pyplot, fig)
 
         # sentiment analysis
-        st.title("Sentiment Analysis")
-        sentiment = helper.sentiment_analysis(selected_user, df)
-
-        fig, ax = plt.subplots()
-        ax.bar(sentiment.keys(), sentiment.values(), color=['green', 'red', 'gray'])
-        st.pyplot(fig)
+        if st.toggle("Sentiment Analysis"):
+            st.title("Sentiment Analysis")
+            sentiment = heavy_section('sentiment_analysis', helper.sentiment_analysis,
+                                      progress=True, pool=jobs.cpu_pool())
+            if sentiment is not None:
+                fig, ax = plt.subplots()
+                ax.bar(sentiment.keys(), sentiment.values(), color=['green', 'red', 'gray'])
+                prof.call('figure: sentiment', st.pyplot, fig)
 
         # user personality
-        st.title("User Personality Summary")
-        personality = helper.user_personality(df)
-
-        for user, tag in personality.items():
-            st.write(f"**{user}** : {tag}")
+        if st.toggle("User Personality Summary"):
+            st.title("User Personality Summary")
+            if chat.has_rows:
+                personality = heavy_section('user_personality', helper.user_personality)
+            else:
+                personality = chat.manifest['personality']
+                if whole_chat_only:
+                    st.caption(helper.WHOLE_CHAT_NOTE)
+
+            for user, tag in (personality or {}).items():
+                st.write(f"**{user}** : {tag}")
+
+        # conversations, from the chat's sessions
+        if chat.has_rows and st.toggle("Conversations"):
+            st.title("Conversations")
+            summary, starters = section(f'conversation_stats/{gap_minutes}',
+                                        lambda q: helper.conversation_stats(q, gap))
+            cols = st.columns(len(summary))
+            for col, (label, value) in zip(cols, summary.items()):
+                col.metric(label, value)
+
+            st.header("Conversation starters")
+            fig, ax = plt.subplots()
+            ax.bar(starters.index.astype(str), starters.values, color='teal')
+            plt.xticks(rotation='vertical')
+            prof.call('figure: conversation starters', st.pyplot, fig)
+
+        if chat.has_rows and st.toggle("Response times"):
+            st.title("Response times")
+            times = section(f'response_times/{gap_minutes}', lambda q: helper.response_times(q, gap))
+            if selected_user != 'Overall':
+                st.caption(f"Median minutes {selected_user} takes to answer each person")
+            else:
+                st.caption("Median minutes each user takes to answer")
+            fig, ax = plt.subplots()
+            ax.barh(times.index.astype(str), times.values, color='steelblue')
+            ax.set_xlabel("Minutes")
+            prof.call('figure: response times', st.pyplot, fig)
+
+        if chat.has_rows and st.toggle("Who replies to whom"):
+            st.title("Who replies to whom")
+            graph = section(f'reply_graph/{gap_minutes}', lambda q: helper.reply_graph(q, gap))
+            if graph.empty:
+                st.write("No replies in this range.")
+            else:
+                fig, ax = plt.subplots()
+                ax = sns.heatmap(graph, cmap='YlOrRd', ax=ax)
+                ax.set_xlabel("Replied to")
+                ax.set_ylabel("Reply from")
+                prof.call('figure: reply graph', st.pyplot, fig)
 
         # ---------------- FINAL INSIGHTS ----------------
-        st.markdown("## Chat Insights")
+        if st.toggle("Chat Insights"):
+            st.markdown("## Chat Insights")
 
-        # sentiment insight
-        total_msgs = sum(sentiment.values())
-        dominant_sentiment = max(sentiment, key=sentiment.get)
+            # sentiment insight
+            sentiment = heavy_section('sentiment_analysis', helper.sentiment_analysis,
+                                      progress=True, pool=jobs.cpu_pool())
+            if sentiment is not None:
+                total_msgs = sum(sentiment.values())
+                dominant_sentiment = max(sentiment, key=sentiment.get)
 
-        st.markdown(f"• Overall chat sentiment is **{dominant_sentiment}**.")
+                st.markdown(f"• Overall chat sentiment is **{dominant_sentiment}**.")
 
-        # activity insight
-        busy_day = helper.week_activity_map(selected_user, df)
-        most_active_day = busy_day.idxmax()
+            # activity insight
+            busy_day = section('week_activity_map', helper.week_activity_map)
+            most_active_day = busy_day.idxmax()
 
-        st.markdown(f"• Most conversations happen on **{most_active_day}**.")
+            st.markdown(f"• Most conversations happen on **{most_active_day}**.")
 
-        # night activity insight
-        night_msgs = df[(df['hour'] >= 0) & (df['hour'] <= 5)].shape[0]
-        night_percent = round((night_msgs / df.shape[0]) * 100, 2)
+            # night activity insight, over everyone in the range
+            hours = helper.most_active_hour(q.overall())
+            night_msgs = hours[(hours.index >= 0) & (hours.index <= 5)].sum()
+            night_percent = round((night_msgs / hours.sum()) * 100, 2)
 
-        if night_percent > 10:
-            st.markdown(f"• **{night_percent}%** of messages are sent late at night.")
+            if night_percent > 10:
+                st.markdown(f"• **{night_percent}%** of messages are sent late at night.")
 
-        # user dominance insight (only overall)
-        if selected_user == "Overall":
-            top_user = df['user'].value_counts().idxmax()
-            share = round(
-                (df['user'].value_counts().max() / df.shape[0]) * 100, 2
-            )
-            st.markdown(f"• **{top_user}** contributes **{share}%** of total messages.")
+            # user dominance insight (only overall)
+            if selected_user == "Overall":
+                users = q.cube().groupby('user', observed=True)['messages'].sum()
+                top_user = users.idxmax()
+                share = round(
+                    (users.max() / users.sum()) * 100, 2
+                )
+                st.markdown(f"• **{top_user}** contributes **{share}%** of total messages.")
 
         # FULL PDF REPORT
         def generate_pdf(df, stats, plots):
+            from reportlab.platypus import SimpleDocTemplate
+            from reportlab.lib.pagesizes import A4
             file_name = "WhatsApp_Chat_Analysis_Report.pdf"
             doc = SimpleDocTemplate(
                 file_name,
@@ -250,12 +480,57 @@ if uploaded_file is not None:
         # ---------------- PDF DOWNLOAD BUTTON ----------------
         st.title("Download Report")
 
-        pdf_buffer = helper.generate_complete_pdf_report(selected_user, df)
-
-        st.download_button(
-            label="📄 Download Full PDF Report",
-            data=pdf_buffer,
-            file_name="WhatsApp_Chat_Analysis_Report.pdf",
-            mime="application/pdf"
-        )
+        # the report is only built when asked for, from the aggregates above
+        quality = st.selectbox("Report quality", list(report.QUALITY_DPI), index=len(report.QUALITY_DPI) - 1)
+        report_key = (chat_key, selected_user, start_date, end_date, quality)
+
+        if st.button("Prepare PDF report"):
+            st.session_state['report_key'] = report_key
+
+        built = None
+        if st.session_state.get('report_key') == report_key:
+            built = background(('report',) + report_key, 'generate_complete_pdf_report', build_report,
+                               q, quality, progress=True, pool=jobs.cpu_pool())
+
+        if built is not None:
+            pdf_bytes, timings = built
+            st.download_button(
+                label="📄 Download Full PDF Report",
+                data=pdf_bytes,
+                file_name="WhatsApp_Chat_Analysis_Report.pdf",
+                mime="application/pdf"
+            )
 
+            with st.expander("Report timing"):
+                st.table(pd.Series(timings, name="seconds"))
+
+        # ---------------- SNAPSHOT DOWNLOAD ----------------
+        # the whole chat's aggregates, to reopen here without the export
+        st.title("Download Snapshot")
+
+        if st.button("Prepare snapshot"):
+            st.session_state['snapshot_key'] = chat_key
+
+        if st.session_state.get('snapshot_key') == chat_key:
+            snapshot_bytes = background(('snapshot', chat_key), 'write_snapshot', build_snapshot, chat)
+            if snapshot_bytes is not None:
+                st.download_button(
+                    label="🗂 Download Analysis Snapshot",
+                    data=snapshot_bytes,
+                    file_name="WhatsApp_Chat_Snapshot.zip",
+                    mime="application/zip"
+                )
+
+# performance panel, plus structured logs and the Prometheus text file
+if prof.records:
+    prof.log()
+    if profiling.METRICS_FILE:
+        prof.write_prometheus(profiling.METRICS_FILE)
+
+if show_performance:
+    with st.sidebar.expander("Performance", expanded=True):
+        stages = prof.frame()
+        st.caption(f"{stages['seconds'].sum():.3f}s over {len(stages)} stages")
+        st.dataframe(stages.sort_values('seconds', ascending=False), hide_index=True)
+        st.caption("Shared chats")
+        st.dataframe(pd.DataFrame(store.stats()), hide_index=True)
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import subprocess
+import pandas as pd
+import preprocessor
+import features
+import sentiment
+import incremental
+import helper
+import synthetic
+from query import Chat
+
+# time and memory-profile parsing and the helper functions on synthetic
+# chats; results go to a JSON file that a later run can be compared with:
+#   python benchmark.py --sizes 10k,100k,1m -o bench.json
+#   python benchmark.py --sizes 10k,100k,1m --compare bench.json
+
+DATA_DIR = '.bench_data'
+
+SIZES = '10k,100k,1m,10m'
+
+# a run slower than the baseline by more than this factor is a regression
+THRESHOLD = 1.2
+
+# differences below this many seconds are timer noise, never regressions
+MIN_DELTA = 0.005
+
+# building the frame the helpers read, timed as stages of its own
+STAGES = ['preprocess', 'add_features', 'add_polarity', 'aggregate']
+
+HELPERS = {
+    'fetch_stats': helper.fetch_stats,
+    'most_common_words': helper.most_common_words,
+    'create_wordcloud': helper.create_wordcloud,
+    'emoji_helper': helper.emoji_helper,
+    'sentiment_analysis': helper.sentiment_analysis,
+    'user_personality': helper.user_personality,
+    'activity_heatmap': helper.activity_heatmap,
+    'timeline': helper.timeline,
+    'generate_complete_pdf_report': lambda q: helper.generate_complete_pdf_report(q, workers=1),
+}
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+# generated exports are kept between runs, they take a while at 10M
+def chat_path(size, locale, users, data_dir):
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"chat-{locale}-{users}u-{size}.txt")
+    if not os.path.exists(path):
+        tmp = path + '.tmp'
+        synthetic.write_chat(tmp, size, users=users, locale=locale)
+        os.replace(tmp, path)
+    return path
+
+# best wall time over the runs, then one more run under tracemalloc for the
+# peak; tracing slows the code down, so it is never part of the timing
+def measure(func, repeat, memory):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        runs.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, {'seconds': min(runs), 'runs': runs, 'peak_mb': peak}
+
+def bench_size(size, args, only):
+    path = chat_path(size, args.locale, args.users, args.data_dir)
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    results = []
+    def record(name, func):
+        # stages left out of the report still build what the helpers read
+        if only is not None and name not in only:
+            return func()
+        result, stats = measure(func, args.repeat, not args.no_memory)
+        results.append(dict(size=size, function=name, **stats))
+        peak = f"{stats['peak_mb']:9.1f} MB" if stats['peak_mb'] is not None else ''
+        print(f"{size:>10} {name:<30} {stats['seconds']:9.3f} s {peak}", flush=True)
+        return result
+
+    df = record('preprocess', lambda: preprocessor.preprocess(text, compact=True))
+    del text
+    df = record('add_features', lambda: features.add_features(df.copy()))
+
+    # scores are memoized per process; start each run cold so every run
+    # times the scoring itself (pool workers are not seen by tracemalloc)
+    def score():
+        sentiment._memo.clear()
+        return sentiment.add_polarity(df.copy())
+    df = record('add_polarity', score)
+    aggregates = record('aggregate', lambda: incremental.aggregate(df))
+
+    chat = Chat(df, aggregates)
+    for name, func in HELPERS.items():
+        # a fresh query per run, as after a widget change in the dashboard
+        record(name, lambda: func(chat.query(args.user)))
+    return results
+
+def compare(results, baseline, threshold):
+    base = {(r['size'], r['function']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    print(f"\ncompared with {baseline.get('commit') or 'baseline'}:")
+    for r in results:
+        old = base.get((r['size'], r['function']))
+        if old is None:
+            continue
+        ratio = r['seconds'] / old if old > 0 else float('inf')
+        flag = ' REGRESSION' if ratio > threshold and r['seconds'] - old > MIN_DELTA else ''
+        print(f"{r['size']:>10} {r['function']:<30} {old:9.3f} s -> {r['seconds']:9.3f} s "
+              f"({ratio:5.2f}x){flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing and analytics on synthetic chats.")
+    parser.add_argument('--sizes', default=SIZES, help=f"messages per chat (default: {SIZES})")
+    parser.add_argument('--functions', help="comma separated subset of stages and helpers to report")
+    parser.add_argument('--locale', choices=list(synthetic.LOCALES), default='android_12h')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--user', default='Overall', help="user the helpers are run for")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('-o', '--output', help="write the results as JSON")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    only = set(args.functions.split(',')) if args.functions else None
+    if only is not None and only - set(STAGES) - set(HELPERS):
+        parser.error(f"unknown functions: {', '.join(sorted(only - set(STAGES) - set(HELPERS)))}")
+
+    results = []
+    for size in [parse_size(s) for s in args.sizes.split(',')]:
+        results.extend(bench_size(size, args, only))
+
+    report = {
+        'commit': git_commit(),
+        'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': {'locale': args.locale, 'users': args.users, 'user': args.user,
+                   'repeat': args.repeat},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
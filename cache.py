@@ -0,0 +1,87 @@
+import os
+import shutil
+import hashlib
+import pyarrow.feather as feather
+import preprocessor
+
+# parsed chats are stored as uncompressed Feather files so they can be
+# memory-mapped straight back into a DataFrame
+CACHE_DIR = os.environ.get('CHAT_CACHE_DIR', '.chat_cache')
+MAX_BYTES = int(os.environ.get('CHAT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# bump when the parsed frame changes shape so stale entries are never read
+CACHE_VERSION = 8
+
+# per-chat state directories of incremental loading, kept under the cache
+# directory and counted against MAX_BYTES with the frames
+STATE_SUBDIR = 'chats'
+
+
+def content_hash(source, chunk_size=preprocessor.CHUNK_SIZE):
+    digest = hashlib.sha256()
+    stream, owned = preprocessor._open_source(source)
+    try:
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            digest.update(chunk)
+        stream.seek(0)
+    finally:
+        if owned:
+            stream.close()
+    return digest.hexdigest()
+
+def _path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}-v{CACHE_VERSION}.feather")
+
+# a missing or damaged entry (ArrowInvalid is a ValueError) is a miss
+def get(key, cache_dir=CACHE_DIR):
+    path = _path(key, cache_dir)
+    try:
+        df = feather.read_table(path, memory_map=True).to_pandas()
+    except (OSError, ValueError):
+        return None
+
+    # touch the entry so eviction sees it as recently used
+    os.utime(path)
+    return df
+
+def put(key, df, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _path(key, cache_dir)
+    tmp = path + ".tmp"
+    feather.write_feather(df.reset_index(drop=True), tmp, compression='uncompressed')
+    os.replace(tmp, path)
+    evict(cache_dir, max_bytes)
+
+def _dir_size(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    return total
+
+# frames and chat state directories, least recently used first, until the
+# cache fits in max_bytes
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".feather"):
+            path = os.path.join(cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    state_root = os.path.join(cache_dir, STATE_SUBDIR)
+    if os.path.isdir(state_root):
+        for name in os.listdir(state_root):
+            path = os.path.join(state_root, name)
+            entries.append((os.stat(path).st_mtime, _dir_size(path), path))
+
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+        total -= size
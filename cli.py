@@ -0,0 +1,147 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import preprocessor
+import features
+import helper
+import incremental
+import snapshot
+from query import Chat
+
+# analyze a directory of exported chats without the dashboard:
+#   python cli.py exports/ -o results/ --jobs 8 --pdf
+
+
+def find_chats(input_dir):
+    pattern = os.path.join(input_dir, '**', '*.txt')
+    return sorted(glob.glob(pattern, recursive=True))
+
+def output_base(path, input_dir, output_dir):
+    name = os.path.splitext(os.path.relpath(path, input_dir))[0]
+    return os.path.join(output_dir, name)
+
+def is_done(path, base):
+    summary = base + '.json'
+    return os.path.exists(summary) and os.path.getmtime(summary) >= os.path.getmtime(path)
+
+def summarize(q):
+    df = q.frame()
+    num_messages, words, num_media_msg, num_links = helper.fetch_stats(q)
+    busy, _ = helper.most_busy_users(q)
+    common = helper.most_common_words(q)
+    emoji_df = helper.emoji_helper(q)
+    timeline = helper.monthly_timeline(q)
+
+    return {
+        'date_range': list(preprocessor.get_date_range(df)),
+        'messages': num_messages,
+        'words': words,
+        'media': num_media_msg,
+        'links': num_links,
+        'avg_message_length': float(helper.avg_message_length(q)),
+        'busy_users': {str(user): int(count) for user, count in busy.items()},
+        'common_words': [[word, int(count)] for word, count in common.values.tolist()],
+        'emojis': [[e, int(count)] for e, count in emoji_df.head(20).values.tolist()],
+        'monthly_timeline': dict(zip(timeline['time'], timeline['message'].astype(int).tolist())),
+        'sentiment': helper.sentiment_analysis(q),
+        'personality': helper.user_personality(q),
+    }
+
+def analyze_chat(path, base, pdf=False, formats=('json',)):
+    df = preprocessor.read_chat(path, compact=True)
+    if df.empty:
+        raise ValueError("no messages found, is this a WhatsApp export?")
+    df = features.add_features(df)
+    chat = Chat(df, incremental.aggregate(df))
+    # the summary needs sentiment; each chat already runs in its own
+    # worker, so score it inline
+    chat.ensure_polarity(workers=1)
+    q = chat.query()
+
+    os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+
+    if 'parquet' in formats:
+        chat.aggregate('cube').to_parquet(base + '.cube.parquet', index=False)
+
+    if 'snapshot' in formats:
+        snapshot.write_snapshot(chat, base + '.snapshot.zip')
+
+    if pdf:
+        buffer = helper.generate_complete_pdf_report(q, workers=1)
+        with open(base + '.pdf', 'wb') as f:
+            f.write(buffer.getvalue())
+
+    # the JSON summary is written last and atomically, it marks the chat done
+    summary = summarize(q)
+    tmp = base + '.json.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, base + '.json')
+    return len(df)
+
+def _run(path, base, pdf, formats):
+    try:
+        return path, analyze_chat(path, base, pdf, formats), None
+    except Exception:
+        return path, None, traceback.format_exc()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of exported WhatsApp chats.")
+    parser.add_argument('input_dir', help="directory searched recursively for .txt exports")
+    parser.add_argument('-o', '--output-dir', default='results')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="chats analyzed in parallel (default: number of cores)")
+    parser.add_argument('--pdf', action='store_true', help="also write the full PDF report")
+    parser.add_argument('--parquet', action='store_true', help="also write the aggregate cube as Parquet")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="also write an analysis snapshot the dashboard can open")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="re-analyze chats whose summary is already up to date")
+    args = parser.parse_args(argv)
+
+    formats = ('json',) + (('parquet',) if args.parquet else ()) + (('snapshot',) if args.snapshot else ())
+    chats = find_chats(args.input_dir)
+    todo = []
+    skipped = 0
+    for path in chats:
+        base = output_base(path, args.input_dir, args.output_dir)
+        if not args.no_resume and is_done(path, base):
+            skipped += 1
+        else:
+            todo.append((path, base))
+
+    failures = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(_run, path, base, args.pdf, formats) for path, base in todo]
+        for future in as_completed(futures):
+            path, rows, error = future.result()
+            if error is None:
+                print(f"ok     {path} ({rows} messages)")
+            else:
+                failures[path] = error
+                print(f"FAILED {path}\n{error}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    failures_path = os.path.join(args.output_dir, 'failures.json')
+    if failures:
+        os.makedirs(args.output_dir, exist_ok=True)
+        with open(failures_path, 'w', encoding='utf-8') as f:
+            json.dump(failures, f, indent=2)
+    elif os.path.exists(failures_path):
+        os.remove(failures_path)
+
+    done = len(todo) - len(failures)
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"{done} chats analyzed in {elapsed:.1f}s ({rate:.2f} chats/s), "
+          f"{len(failures)} failed, {skipped} skipped")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
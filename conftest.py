@@ -0,0 +1,2 @@
+# the app's modules sit at the top of the tree; this file puts it on
+# sys.path for the tests under tests/
@@ -0,0 +1,46 @@
+import pandas as pd
+import features
+from preprocessor import DAYS, MONTHS, TIME_PERIODS
+
+CUBE_KEYS = ['user', 'only_date', 'hour', 'day_name']
+
+
+# message, word, character, media, link and emoji counts per (user, date,
+# hour, weekday), built in one groupby so every per-user view is a slice of it
+def build_cube(df):
+    df = features.ensure_features(df)
+
+    df = df.assign(only_date=pd.to_datetime(df['only_date']))
+    measures = dict(
+        messages=('message', 'size'),
+        words=('word_count', 'sum'),
+        chars=('char_count', 'sum'),
+        media=('is_media', 'sum'),
+        links=('link_count', 'sum'),
+        emojis=('emoji_count', 'sum'),
+    )
+
+    # sentiment tallies ride along when polarity has been scored
+    if 'polarity' in df:
+        df = df.assign(positive=df['polarity'] > 0, negative=df['polarity'] < 0,
+                       neutral=df['polarity'] == 0)
+        measures.update(positive=('positive', 'sum'), negative=('negative', 'sum'),
+                        neutral=('neutral', 'sum'))
+
+    cube = df.groupby(CUBE_KEYS, observed=True).agg(**measures).reset_index()
+    return cube
+
+# add the cube of newly arrived messages to an existing one
+def merge_cubes(cube, delta):
+    merged = pd.concat([cube, delta], ignore_index=True)
+    merged['user'] = merged['user'].astype('category')
+    merged['day_name'] = merged['day_name'].astype(str).astype(pd.CategoricalDtype(DAYS))
+    return merged.groupby(CUBE_KEYS, observed=True).sum().reset_index()
+
+def time_periods(hours):
+    codes = pd.Categorical.from_codes(hours.astype('int8'), categories=TIME_PERIODS)
+    return pd.Series(codes, index=hours.index, name='time_period')
+
+def months(month_nums):
+    codes = pd.Categorical.from_codes(month_nums.astype('int8') - 1, categories=MONTHS)
+    return pd.Series(codes, index=month_nums.index, name='month')
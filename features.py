@@ -0,0 +1,127 @@
+import os
+import re
+from functools import lru_cache
+import pandas as pd
+
+STOP_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stop_hinglish.txt')
+
+# messages left out of word frequencies
+SKIP_PATTERN = r'media omitted|edited'
+
+MEDIA_MESSAGE = '<Media omitted>\n'
+
+FEATURE_COLUMNS = ['word_count', 'char_count', 'is_media', 'link_count', 'emojis', 'emoji_count']
+
+# cheap test for text that might hold a URL (a scheme separator or a dot
+# between word characters, which covers domains and bare IPs); only such
+# texts reach URLExtract
+LINK_CANDIDATE = re.compile(r'://|\w\.\w')
+
+
+@lru_cache(maxsize=None)
+def load_stop_words(path=STOP_WORDS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return frozenset(f.read().split())
+
+# per-message features computed once per chat and stored in the parsed frame
+def add_features(df):
+    df['word_count'] = df['message'].str.split().str.len().fillna(0).astype('int32')
+    df['char_count'] = df['message'].str.len().fillna(0).astype('int32')
+    df['is_media'] = df['message'] == MEDIA_MESSAGE
+    df['link_count'] = count_links(df['message'])
+    df['emojis'], df['emoji_count'] = extract_emojis(df['message'])
+    return df
+
+def ensure_features(df):
+    if all(col in df for col in FEATURE_COLUMNS):
+        return df
+    return add_features(df.copy())
+
+# matches wherever emoji.emoji_list could start a match: any character that
+# begins an emoji, with the ASCII ones (keycaps) only when followed by U+20E3;
+# built on first use, like the emoji table it comes from
+@lru_cache(maxsize=None)
+def emoji_candidate():
+    import emoji
+    return re.compile(
+        '[' + ''.join(sorted(re.escape(e[0]) for e in emoji.EMOJI_DATA if not e[0].isascii())) + ']'
+        + '|[#*0-9]\ufe0f?\u20e3'
+    )
+
+# URLExtract loads its TLD list on construction, so build it on first use
+@lru_cache(maxsize=None)
+def get_url_extractor():
+    from urlextract import URLExtract
+    return URLExtract()
+
+def count_links(messages):
+    candidates = messages[messages.str.contains(LINK_CANDIDATE, na=False)]
+
+    extract = get_url_extractor()
+    found = {text: len(extract.find_urls(text)) for text in candidates.unique()}
+
+    counts = candidates.map(found)
+    return counts.reindex(messages.index, fill_value=0).astype('int32')
+
+# emoji per message as a space separated string, plus their count; only
+# distinct texts that can contain an emoji go through emoji.emoji_list
+def extract_emojis(messages):
+    import emoji
+    candidates = messages[messages.str.contains(emoji_candidate(), na=False)]
+
+    found = {}
+    for text in candidates.unique():
+        found[text] = [e['emoji'] for e in emoji.emoji_list(text)]
+
+    # cast before reindexing: with no candidates the maps keep the str dtype,
+    # which refuses an integer fill value
+    emojis = candidates.map({text: ' '.join(found[text]) for text in found}).astype(object)
+    counts = candidates.map({text: len(found[text]) for text in found}).astype('int32')
+    return (
+        emojis.reindex(messages.index, fill_value=''),
+        counts.reindex(messages.index, fill_value=0),
+    )
+
+def word_counts(df):
+    if 'word_count' in df:
+        return df['word_count']
+    return df['message'].str.split().str.len().fillna(0)
+
+# term frequencies indexed by (user, word), without stopwords
+def term_index(df):
+    stop_words = load_stop_words()
+
+    temp = df[df['user'] != 'group_notification']
+    temp = temp[~temp['message'].str.contains(SKIP_PATTERN, case=False, na=False)]
+
+    words = temp['message'].str.lower().str.split().explode().dropna()
+    words = words[~words.isin(stop_words)]
+
+    tokens = pd.DataFrame({
+        'user': temp['user'].loc[words.index].to_numpy(),
+        'word': words.to_numpy(),
+    })
+    return tokens.groupby(['user', 'word'], observed=True).size().rename('count')
+
+def user_terms(selected_user, terms):
+    if selected_user == 'Overall':
+        return terms.groupby(level='word').sum()
+    return terms[terms.index.get_level_values('user') == selected_user].droplevel('user')
+
+# emoji counts indexed by (user, emoji)
+def emoji_index(df):
+    df = ensure_features(df)
+
+    temp = df[df['emoji_count'] > 0]
+    found = temp['emojis'].str.split().explode()
+
+    tokens = pd.DataFrame({
+        'user': temp['user'].loc[found.index].to_numpy(),
+        'emoji': found.to_numpy(),
+    })
+    return tokens.groupby(['user', 'emoji'], observed=True).size().rename('count')
+
+def user_emojis(selected_user, emojis):
+    if selected_user == 'Overall':
+        return emojis.groupby(level='emoji').sum()
+    return emojis[emojis.index.get_level_values('user') == selected_user].droplevel('user')
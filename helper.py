@@ -1,236 +1,314 @@
-from urlextract import URLExtract
-from wordcloud import WordCloud
 import pandas as pd
-from collections import Counter
-import emoji
-from io import BytesIO
-import tempfile
-from reportlab.platypus import SimpleDocTemplate
-from reportlab.lib.pagesizes import A4
-import matplotlib.pyplot as plt
-import seaborn as sns
-from textblob import TextBlob
-from reportlab.platypus import Image, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-import os
-extract = URLExtract()
-
-def fetch_stats(selected_user, df):
-
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import features
+import sessions
+import timelines
+import report
+from cube import months, time_periods
+
+# value counts of a categorical column without its unused categories
+def _observed_counts(series):
+    counts = series.value_counts()
+    return counts[counts > 0]
+
+# shown by word and emoji views of a snapshot over part of its date range,
+# which can only count the whole chat
+WHOLE_CHAT_NOTE = "Whole chat: the snapshot has no messages to count a date range from."
+
+# every helper takes a query.Query: one user (or 'Overall') over a date range
+def fetch_stats(query):
+    df = query.cube()
 
     #fetch nuber of messages
-    num_messages = df.shape[0]
+    num_messages = int(df['messages'].sum())
 
     #fetch number of words
-    words = []
-    for message in df['message']:
-        words.extend(message.split())
+    words = int(df['words'].sum())
 
     #fetch number of media shared
-    num_media_msg = df[df['message'] == '<Media omitted>\n'].shape[0]
+    num_media_msg = int(df['media'].sum())
 
     #fetch number of links shared
-    links = []
-    for message in df['message']:
-        links.extend(extract.find_urls(message))
-    return num_messages, len(words),num_media_msg, len(links)
+    links = int(df['links'].sum())
+    return num_messages, words,num_media_msg, links
 
-def most_busy_users(df):
+def most_busy_users(query):
     # remove group notifications
+    df = query.overall().cube()
     temp = df[df['user'] != 'group_notification']
 
-    x = temp['user'].value_counts().head()
+    counts = temp.groupby('user', observed=True)['messages'].sum()
+    counts = counts[counts > 0].sort_values(ascending=False, kind='stable').rename('count')
+    x = counts.head()
     percent_df = round(
-        temp['user'].value_counts() / temp.shape[0] * 100, 2
+        counts / counts.sum() * 100, 2
     ).reset_index().rename(columns={'index': 'name', 'user': 'percent'})
 
     return x, percent_df
 
 # average message length per user
-def avg_message_length(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def avg_message_length(query):
+    df = query.cube()
 
     temp = df[df['user'] != 'group_notification']
-    temp['msg_len'] = temp['message'].apply(len)
-
-    return round(temp['msg_len'].mean(), 2)
+    messages = temp['messages'].sum()
+    if not messages:
+        return float('nan')
+    return round(temp['chars'].sum() / messages, 2)
 
 
 # most active hour
-def most_active_hour(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    return df['hour'].value_counts().sort_index()
-
-
-def create_wordcloud(selected_user, df):
-    f = open('stop_hinglish.txt', 'r')
-    stop_words = f.read()
-
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[~temp['message'].str.contains(r'media omitted|edited', case=False, na=False)]
-
-    def remove_stopwords(message):
-        y = []
-        for word in message.lower().split():
-            if word not in stop_words:
-                y.append(word)
-        return ' '.join(y)
-
-    wc = WordCloud(width=500, height=500, min_font_size=10, background_color='white')
-    temp['message'] = temp['message'].apply(remove_stopwords)
-    df_wc = wc.generate(temp['message'].str.cat(sep=" "))
+def most_active_hour(query):
+    df = query.cube()
+
+    return df.groupby('hour')['messages'].sum().rename('count').sort_index()
+
+
+# rendered wordcloud bitmaps by (chat key, user, date range, size), shared
+# by the dashboard and the PDF report; jobs on several threads use it
+WORDCLOUD_CACHE_SIZE = 32
+_wordclouds = OrderedDict()
+_wordclouds_lock = threading.Lock()
+
+def create_wordcloud(query, width=500, height=500):
+    key = None
+    if query.chat.key is not None:
+        key = (query.chat.key, query.user, query.date_range(), (width, height))
+        with _wordclouds_lock:
+            if key in _wordclouds:
+                _wordclouds.move_to_end(key)
+                return _wordclouds[key]
+
+    frequencies = features.user_terms(query.user, query.terms())
+
+    from wordcloud import WordCloud
+    wc = WordCloud(width=width, height=height, min_font_size=10, background_color='white')
+    df_wc = wc.generate_from_frequencies(frequencies.to_dict()).to_array()
+    df_wc.setflags(write=False)  # shared by every view of the cache entry
+
+    if key is not None:
+        with _wordclouds_lock:
+            _wordclouds[key] = df_wc
+            if len(_wordclouds) > WORDCLOUD_CACHE_SIZE:
+                _wordclouds.popitem(last=False)
     return df_wc
 
-def most_common_words(selected_user, df):
-    f = open('stop_hinglish.txt', 'r')
-    stop_words = f.read()
+def most_common_words(query):
+    frequencies = features.user_terms(query.user, query.terms())
 
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[~temp['message'].str.contains(r'media omitted|edited', case=False,na=False)]
-
-    words = []
-    for message in temp['message']:
-        for word in message.lower().split():
-            if word not in stop_words:
-                words.append(word)
-
-    most_common_df = pd.DataFrame(Counter(words).most_common(20))
+    most_common_df = pd.DataFrame(list(frequencies.nlargest(20).items()))
     return most_common_df
 
-def emoji_helper(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    emojis = []
-    for message in df['message']:
-        emojis.extend([e['emoji'] for e in emoji.emoji_list(message)])
-
-    emoji_df = pd.DataFrame(Counter(emojis).most_common(len(Counter(emojis))))
+def emoji_helper(query):
+    counts = features.user_emojis(query.user, query.emojis()).sort_values(ascending=False, kind='stable')
+    emoji_df = pd.DataFrame(list(counts.items()))
 
     return emoji_df
 
-def monthly_timeline(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def monthly_timeline(query):
+    df = query.cube()
 
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['message'].reset_index()
-    time = []
-    for i in range(timeline.shape[0]):
-        time.append(timeline['month'][i] + "-" + str(timeline['year'][i]))
-
-    timeline['time'] = time
+    dates = df['only_date'].dt
+    timeline = df.groupby([dates.year.rename('year'), dates.month.rename('month_num')])['messages'].sum()
+    timeline = timeline.rename('message').reset_index()
+    timeline.insert(2, 'month', months(timeline['month_num']))
+    timeline['time'] = timeline['month'].astype(str) + "-" + timeline['year'].astype(str)
 
     return timeline
 
-def daily_timeline(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def daily_timeline(query):
+    df = query.cube()
 
-    daily_timeline = df.groupby('only_date').count()['message'].reset_index()
+    daily_timeline = df.groupby('only_date')['messages'].sum().rename('message').reset_index()
 
     return daily_timeline
 
-def week_activity_map(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    return df['day_name'].value_counts()
-
-def month_activity_map(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+# pixels across a timeline chart, in the dashboard and the PDF report
+TIMELINE_WIDTH = 1200
 
-    return df['month'].value_counts()
+# messages over time at a resolution that fits width pixels, or the one
+# asked for ('day', 'week' or 'month'); returns (frame, resolution)
+def timeline(query, width=TIMELINE_WIDTH, resolution='auto'):
+    daily = daily_timeline(query).set_index('only_date')['message']
+    return timelines.build(daily, width, resolution)
 
-def activity_heatmap(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def week_activity_map(query):
+    df = query.cube()
 
-    user_heatmap = df.pivot_table(index='day_name', columns='time_period', values='message', aggfunc='count').fillna(0)
-
-    return user_heatmap
+    counts = df.groupby('day_name', observed=True)['messages'].sum()
+    return counts[counts > 0].sort_values(ascending=False).rename('count')
 
-# user personality tags
-def user_personality(df):
-    temp = df[df['user'] != 'group_notification']
+def month_activity_map(query):
+    df = query.cube()
 
-    personality = {}
+    counts = df.groupby(months(df['only_date'].dt.month), observed=True)['messages'].sum()
+    return counts[counts > 0].sort_values(ascending=False).rename('count')
 
-    # most talkative
-    talkative = temp['user'].value_counts().idxmax()
-    personality[talkative] = "📢 Most Talkative"
+def activity_heatmap(query):
+    df = query.cube()
 
-    # longest messages
-    temp['msg_len'] = temp['message'].apply(len)
-    long_msg_user = temp.groupby('user')['msg_len'].mean().idxmax()
-    personality[long_msg_user] = personality.get(long_msg_user, "") + " 📝 Long Message Sender"
+    user_heatmap = df.assign(time_period=time_periods(df['hour'])).pivot_table(
+        index='day_name', columns='time_period', values='messages',
+        aggfunc='sum', observed=True).fillna(0)
 
-    # emoji lover
-    emoji_count = {}
-    for user in temp['user'].unique():
-        msgs = temp[temp['user'] == user]['message']
-        emoji_count[user] = sum(len(emoji.emoji_list(m)) for m in msgs)
+    return user_heatmap
 
-    emoji_lover = max(emoji_count, key=emoji_count.get)
-    personality[emoji_lover] = personality.get(emoji_lover, "") + " 😂 Emoji Lover"
+# fewest replies / messages for the fastest responder and weekend warrior
+MIN_REPLIES = 5
+MIN_MESSAGES = 10
+
+WEEKEND = ['Saturday', 'Sunday']
+
+# (column, tag, pick) in the order the tags are written; pick is 'max' or
+# 'min' of the per-user column, skipped when nobody qualifies
+PERSONALITY_TAGS = [
+    ('messages', "📢 Most Talkative", 'max'),
+    ('msg_len', "📝 Long Message Sender", 'max'),
+    ('emojis', "😂 Emoji Lover", 'max'),
+    ('night', "⏱ Night Owl", 'max'),
+    ('reply_secs', "⚡ Fastest Responder", 'min'),
+    ('media', "📸 Media Sharer", 'max'),
+    ('links', "🔗 Link Sharer", 'max'),
+    ('starts', "💬 Conversation Starter", 'max'),
+    ('weekend', "🎉 Weekend Warrior", 'max'),
+]
+
+# user personality tags, from one groupby over per-message features; replies
+# and conversation starts come from the chat's sessions
+def user_personality(query):
+    df = features.ensure_features(query.overall().frame())
+    temp = df[df['user'] != 'group_notification']
+    chat_sessions = query.sessions().reindex(temp.index)
+
+    per_message = pd.DataFrame({
+        'user': temp['user'],
+        'msg_len': temp['char_count'],
+        'emojis': temp['emoji_count'],
+        'night': temp['hour'] <= 5,
+        'media': temp['is_media'],
+        'links': temp['link_count'] > 0,
+        'reply_secs': chat_sessions['response_secs'],
+        'starts': chat_sessions['starts'],
+        'weekend': temp['day_name'].isin(WEEKEND),
+    })
+    stats = per_message.groupby('user', observed=True).agg(
+        messages=('user', 'size'),
+        msg_len=('msg_len', 'mean'),
+        emojis=('emojis', 'sum'),
+        night=('night', 'sum'),
+        media=('media', 'sum'),
+        links=('links', 'sum'),
+        reply_secs=('reply_secs', 'median'),
+        replies=('reply_secs', 'count'),
+        starts=('starts', 'sum'),
+        weekend=('weekend', 'mean'),
+    )
 
-    # night owl (messages between 12am–5am)
-    night_df = temp[(temp['hour'] >= 0) & (temp['hour'] <= 5)]
-    if not night_df.empty:
-        night_owl = night_df['user'].value_counts().idxmax()
-        personality[night_owl] = personality.get(night_owl, "") + " ⏱ Night Owl"
+    # only counts above zero earn a tag; the fastest responder needs enough
+    # replies and the weekend warrior enough messages and more than the
+    # weekend's share of the week
+    stats.loc[stats['replies'] < MIN_REPLIES, 'reply_secs'] = float('nan')
+    stats['weekend'] = stats['weekend'].where(
+        (stats['messages'] >= MIN_MESSAGES) & (stats['weekend'] > len(WEEKEND) / 7))
+    for column in ['emojis', 'night', 'media', 'links', 'starts']:
+        stats[column] = stats[column].where(stats[column] > 0)
 
+    personality = {}
+    for column, tag, pick in PERSONALITY_TAGS:
+        values = stats[column].dropna()
+        if values.empty:
+            continue
+        user = values.idxmax() if pick == 'max' else values.idxmin()
+        personality[user] = (personality[user] + " " + tag) if user in personality else tag
     return personality
 
-# sentiment analysis
-def sentiment_analysis(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+# conversations in the range (those the user took part in, unless
+# 'Overall'): headline numbers and how many each user started
+def conversation_stats(query, gap=sessions.SESSION_GAP):
+    chat_sessions = query.sessions(gap)
+    table = sessions.session_table(chat_sessions)
+    if query.user != 'Overall':
+        joined = chat_sessions.loc[chat_sessions['user'] == query.user, 'session'].unique()
+        table = table.loc[joined]
+
+    summary = {
+        "Conversations": len(table),
+        "Median messages": float(table['messages'].median()) if len(table) else 0.0,
+        "Median minutes": round(float(table['minutes'].median()), 1) if len(table) else 0.0,
+        "Median participants": float(table['participants'].median()) if len(table) else 0.0,
+    }
+    starters = _observed_counts(table['starter']).rename('conversations')
+    return summary, starters
+
+# median minutes to answer: per user, or for one user per person answered
+def response_times(query, gap=sessions.SESSION_GAP):
+    chat_sessions = query.sessions(gap)
+    if query.user != 'Overall':
+        mine = chat_sessions[chat_sessions['user'] == query.user]
+        times = mine.groupby('replied_to', observed=True)['response_secs'].median().dropna().sort_values()
+    else:
+        times = sessions.response_times(chat_sessions)
+    return (times / 60).rename('minutes')
+
+# who replies to whom among the most active repliers (always including the
+# selected user), rows replying to columns
+def reply_graph(query, gap=sessions.SESSION_GAP, top=15):
+    matrix = sessions.reply_matrix(query.sessions(gap))
+    if matrix.empty:
+        return matrix
+    active = matrix.sum(axis=1).nlargest(top).index.tolist()
+    if query.user != 'Overall' and query.user in matrix.index and query.user not in active:
+        active.append(query.user)
+    return matrix.loc[active, [user for user in active if user in matrix.columns]]
+
+# sentiment analysis; the chat is scored the first time it is asked for
+def sentiment_analysis(query, progress=None, pool=None):
+    query.chat.ensure_polarity(progress=progress, pool=pool)
+    df = query.cube()
+    return {
+        "Positive": int(df['positive'].sum()),
+        "Negative": int(df['negative'].sum()),
+        "Neutral": int(df['neutral'].sum()),
+    }
 
-    sentiments = {"Positive": 0, "Negative": 0, "Neutral": 0}
+# report generator
 
-    for msg in df['message']:
-        polarity = TextBlob(msg).sentiment.polarity
-        if polarity > 0:
-            sentiments["Positive"] += 1
-        elif polarity < 0:
-            sentiments["Negative"] += 1
-        else:
-            sentiments["Neutral"] += 1
+# points per inch, as reportlab.lib.units.inch
+inch = 72.0
 
-    return sentiments
-
-# report generator
+# matplotlib and reportlab load in seconds, so they are imported by the
+# functions below, not with this module
 
 def save_plot(fig, name):
+    import matplotlib.pyplot as plt
     path = f"{name}.png"
     fig.savefig(path, bbox_inches="tight")
     plt.close(fig)
     return path
 
-styles = getSampleStyleSheet()
+@lru_cache(maxsize=None)
+def _styles():
+    from reportlab.lib.styles import getSampleStyleSheet
+    return getSampleStyleSheet()
 
 def add_heading(text):
-    return Paragraph(f"<b><font size=14>{text}</font></b>", styles["Normal"])
+    from reportlab.platypus import Paragraph
+    return Paragraph(f"<b><font size=14>{text}</font></b>", _styles()["Normal"])
 
 def add_text(text):
-    return Paragraph(text, styles["Normal"])
+    from reportlab.platypus import Paragraph
+    return Paragraph(text, _styles()["Normal"])
 
 def add_spacer(h=0.3):
+    from reportlab.platypus import Spacer
     return Spacer(1, h * inch)
 
 def add_image(path):
+    from reportlab.platypus import Image
+    from reportlab.lib import colors
     img = Image(path)  
     img.hAlign = "CENTER"
     img.drawHeight = img.drawHeight
@@ -243,190 +321,122 @@ def add_image(path):
 def auto_insights(label, value):
     return f"• <b>{label}</b>: {value}"
 
-def generate_complete_pdf_report(selected_user, df):
-    if selected_user != "Overall":
-        df = df[df['user'] == selected_user]
-
-    buffer = BytesIO()
-    styles = getSampleStyleSheet()
-    story = []
-    images = []
-
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-
-    from reportlab.lib.utils import ImageReader
-
-    def add_plot(fig, title):
-        story.append(Paragraph(f"<b>{title}</b>", styles['Heading2']))
-
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        fig.savefig(tmp.name, bbox_inches="tight", dpi=200)
-        plt.close(fig)
-
-        img_reader = ImageReader(tmp.name)
-        iw, ih = img_reader.getSize()  # REAL pixel size
+def generate_complete_pdf_report(query, quality='high', workers=None, timings=None,
+                                 progress=None, pool=None):
+    if timings is None:
+        timings = {}
+    started = time.perf_counter()
 
-        max_width = doc.width  # usable page width
-        scale = min(1, max_width / iw)  # ONLY scale down if needed
-
-        img = Image(
-            tmp.name,
-            width=iw * scale,
-            height=ih * scale
-        )
-
-        images.append(tmp.name)
-        story.append(img)
-        story.append(Spacer(1, 18))
+    selected_user = query.user
+    df = query.cube()
 
     # ---------- TITLE ----------
-    story.append(Paragraph("<b>WhatsApp Chat Analysis – Full Report</b>", styles['Title']))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph(f"User: {selected_user}", styles['Normal']))
-
-    start = df['only_date'].min()
-    end = df['only_date'].max()
-
-    story.append(
-        Paragraph(
-            f"Date Range: {start} to {end}",
-            styles['Normal']
-        )
-    )
-    story.append(Spacer(1, 12))
+    start = df['only_date'].min().date()
+    end = df['only_date'].max().date()
 
     # ---------- TOP STATS ----------
-    num_msgs = df.shape[0]
-    words = sum(df['message'].apply(lambda x: len(x.split())))
-    media = df[df['message'] == '<Media omitted>\n'].shape[0]
-    links = sum(df['message'].apply(lambda x: len(extract.find_urls(x))))
-
-    story.append(Paragraph("<b>Top Statistics</b>", styles['Heading2']))
-    story.append(Paragraph(f"Total Messages: {num_msgs}", styles['Normal']))
-    story.append(Paragraph(f"Total Words: {words}", styles['Normal']))
-    story.append(Paragraph(f"Media Shared: {media}", styles['Normal']))
-    story.append(Paragraph(f"Links Shared: {links}", styles['Normal']))
-
-    # ---------- MONTHLY TIMELINE ----------
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['message'].reset_index()
-    timeline['time'] = timeline['month'] + "-" + timeline['year'].astype(str)
-    fig, ax = plt.subplots()
-    ax.plot(timeline['time'], timeline['message'], color='blue')
-    plt.xticks(rotation=90)
-    add_plot(fig, "Monthly Timeline")
-
-    # ---------- DAILY TIMELINE ----------
-    daily = df.groupby('only_date').count()['message'].reset_index()
-    fig, ax = plt.subplots()
-    ax.plot(daily['only_date'], daily['message'], color='green')
-    plt.xticks(rotation=90)
-    add_plot(fig, "Daily Timeline")
-
-    # ---------- WEEKLY ACTIVITY ----------
-    week = df['day_name'].value_counts()
-    fig, ax = plt.subplots()
-    ax.bar(week.index, week.values, color='pink')
-    plt.xticks(rotation=45)
-    add_plot(fig, "Weekly Activity")
-
-    # ---------- MONTHLY ACTIVITY ----------
-    month = df['month'].value_counts()
-    fig, ax = plt.subplots()
-    ax.bar(month.index, month.values, color='purple')
-    plt.xticks(rotation=45)
-    add_plot(fig, "Monthly Activity")
-
-    # ---------- HEATMAP ----------
-    heatmap = df.pivot_table(index='day_name', columns='time_period',
-                             values='message', aggfunc='count').fillna(0)
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.heatmap(heatmap, cmap='YlGnBu', ax=ax)
-    add_plot(fig, "Weekly Activity Heatmap")
+    num_msgs, words, media, links = fetch_stats(query)
+
+    header = [
+        ('Title', "<b>WhatsApp Chat Analysis – Full Report</b>"),
+        ('spacer', 12),
+        ('Normal', f"User: {selected_user}"),
+        ('Normal', f"Date Range: {start} to {end}"),
+        ('spacer', 12),
+        ('Heading2', "<b>Top Statistics</b>"),
+        ('Normal', f"Total Messages: {num_msgs}"),
+        ('Normal', f"Total Words: {words}"),
+        ('Normal', f"Media Shared: {media}"),
+        ('Normal', f"Links Shared: {links}"),
+    ]
+    sections = [('text', header)]
+
+    # ---------- TIMELINES AND ACTIVITY ----------
+    monthly = monthly_timeline(query)
+    sections.append(('figure', "Monthly Timeline",
+                     ('line', (monthly['time'].tolist(), monthly['message'].tolist()),
+                      {'color': 'blue', 'rotation': 90})))
+
+    daily, resolution = timeline(query)
+    sections.append(('figure', f"Timeline (messages per {resolution})",
+                     ('line', (daily['date'].tolist(), daily['message'].tolist()),
+                      {'color': 'green', 'rotation': 90})))
+
+    week = week_activity_map(query)
+    sections.append(('figure', "Weekly Activity",
+                     ('bar', (week.index.astype(str).tolist(), week.tolist()),
+                      {'color': 'pink', 'rotation': 45})))
+
+    month = month_activity_map(query)
+    sections.append(('figure', "Monthly Activity",
+                     ('bar', (month.index.astype(str).tolist(), month.tolist()),
+                      {'color': 'purple', 'rotation': 45})))
+
+    heatmap = activity_heatmap(query)
+    sections.append(('figure', "Weekly Activity Heatmap",
+                     ('heatmap', heatmap, {'figsize': (10, 6)})))
 
     # ---------- BUSY USERS ----------
     if selected_user == "Overall":
-        x, _ = most_busy_users(df)
-        fig, ax = plt.subplots()
-        ax.bar(x.index, x.values, color='red')
-        plt.xticks(rotation=45)
-        add_plot(fig, "Most Busy Users")
-
-    # ---------- WORDCLOUD ----------
-    wc = create_wordcloud("Overall", df)
-    fig, ax = plt.subplots()
-    ax.imshow(wc)
-    ax.axis("off")
-    add_plot(fig, "Wordcloud")
-
-    # ---------- COMMON WORDS ----------
-    common = most_common_words("Overall", df)
-    fig, ax = plt.subplots()
-    ax.barh(common[0], common[1], color='orange')
-    add_plot(fig, "Most Common Words")
+        x, _ = most_busy_users(query)
+        sections.append(('figure', "Most Busy Users",
+                         ('bar', (x.index.astype(str).tolist(), x.tolist()),
+                          {'color': 'red', 'rotation': 45})))
+
+    # ---------- WORDCLOUD AND COMMON WORDS ----------
+    note = None
+    if not query.chat.has_rows and not query.full_range:
+        note = WHOLE_CHAT_NOTE
+
+    wc = create_wordcloud(query)
+    sections.append(('figure', "Wordcloud", ('image', wc, {}), note))
+
+    common = most_common_words(query)
+    sections.append(('figure', "Most Common Words",
+                     ('barh', (common[0].tolist(), common[1].tolist()), {'color': 'orange'}),
+                     note))
 
     # ---------- EMOJI ANALYSIS ----------
-    emoji_df = emoji_helper("Overall", df).head()
-    fig, ax = plt.subplots()
-    ax.pie(emoji_df[1], labels=emoji_df[0], autopct="%0.1f%%")
-    add_plot(fig, "Emoji Analysis")
+    emoji_df = emoji_helper(query).head()
+    sections.append(('figure', "Emoji Analysis",
+                     ('pie', (emoji_df[0].tolist(), emoji_df[1].tolist()), {}), note))
 
     # ---------- SENTIMENT ----------
-    sentiment = {"Positive": 0, "Negative": 0, "Neutral": 0}
-    for msg in df['message']:
-        p = TextBlob(msg).sentiment.polarity
-        if p > 0:
-            sentiment["Positive"] += 1
-        elif p < 0:
-            sentiment["Negative"] += 1
-        else:
-            sentiment["Neutral"] += 1
-
-    fig, ax = plt.subplots()
-    ax.bar(sentiment.keys(), sentiment.values(), color=['green', 'red', 'gray'])
-    add_plot(fig, "Sentiment Analysis")
+    sentiments = sentiment_analysis(query, progress, pool)
+    sections.append(('figure', "Sentiment Analysis",
+                     ('bar', (list(sentiments.keys()), list(sentiments.values())),
+                      {'color': ['green', 'red', 'gray']})))
 
     # ---------- FINAL INSIGHTS ----------
-    story.append(add_heading("Chat Insights"))
-    story.append(add_spacer(0.2))
+    insights = [('Normal', "<b><font size=14>Chat Insights</font></b>"), ('spacer', 0.2 * inch)]
 
     # sentiment insight
-    dominant_sentiment = max(sentiment, key=sentiment.get)
-    story.append(
-        add_text(f"• Overall chat sentiment is <b>{dominant_sentiment}</b>.")
-    )
-    story.append(add_spacer(0.1))
+    dominant_sentiment = max(sentiments, key=sentiments.get)
+    insights.append(('Normal', f"• Overall chat sentiment is <b>{dominant_sentiment}</b>."))
+    insights.append(('spacer', 0.1 * inch))
 
     # activity insight
-    most_active_day = df['day_name'].value_counts().idxmax()
-    story.append(
-        add_text(f"• Most conversations happen on <b>{most_active_day}</b>.")
-    )
-    story.append(add_spacer(0.1))
+    most_active_day = week.idxmax()
+    insights.append(('Normal', f"• Most conversations happen on <b>{most_active_day}</b>."))
+    insights.append(('spacer', 0.1 * inch))
 
     # night activity insight
-    night_msgs = df[(df['hour'] >= 0) & (df['hour'] <= 5)].shape[0]
-    night_percent = round((night_msgs / df.shape[0]) * 100, 2)
+    hours = most_active_hour(query)
+    night_msgs = hours[(hours.index >= 0) & (hours.index <= 5)].sum()
+    night_percent = round((night_msgs / num_msgs) * 100, 2)
 
     if night_percent > 10:
-        story.append(
-            add_text(f"• <b>{night_percent}%</b> of messages are sent late at night.")
-        )
-        story.append(add_spacer(0.1))
+        insights.append(('Normal', f"• <b>{night_percent}%</b> of messages are sent late at night."))
+        insights.append(('spacer', 0.1 * inch))
 
     # user dominance insight
-    top_user = df['user'].value_counts().idxmax()
-    share = round((df['user'].value_counts().max() / df.shape[0]) * 100, 2)
-
-    story.append(
-        add_text(
-            f"• <b>{top_user}</b> contributes <b>{share}%</b> of total messages."
-        )
-    )
+    users = query.cube().groupby('user', observed=True)['messages'].sum()
+    top_user = users.idxmax()
+    share = round((users.max() / num_msgs) * 100, 2)
 
-    doc.build(story)
+    insights.append(('Normal', f"• <b>{top_user}</b> contributes <b>{share}%</b> of total messages."))
+    sections.append(('text', insights))
 
-    for img in images:
-        os.remove(img)
+    timings['aggregates'] = time.perf_counter() - started
 
-    buffer.seek(0)
-    return buffer
+    return report.build_pdf(sections, quality, workers, timings, progress, pool)
@@ -0,0 +1,253 @@
+import io
+import os
+import json
+import hashlib
+import pandas as pd
+import preprocessor
+import features
+import sentiment
+import cache
+from cube import build_cube, merge_cubes
+
+# WhatsApp exports are cumulative: a newer export of a chat starts with the
+# bytes of the older one. Each chat keeps its latest parsed frame (in the
+# parse cache) and its aggregates here, so a newer export only parses and
+# aggregates the messages after the part already seen.
+STATE_DIR = os.path.join(cache.CACHE_DIR, cache.STATE_SUBDIR)
+
+# a chat is recognised by the start of its export
+HEAD_BYTES = 4096
+
+STATE_VERSION = 5
+
+# cube columns counted from polarity
+SENTIMENT_TALLIES = ['positive', 'negative', 'neutral']
+
+
+def _chat_id(source):
+    stream, owned = preprocessor._open_source(source)
+    try:
+        stream.seek(0)
+        head = stream.read(HEAD_BYTES)
+        stream.seek(0)
+    finally:
+        if owned:
+            stream.close()
+    return hashlib.sha256(head).hexdigest()
+
+def _read_hashes(source, prefix_length):
+    # one pass over the export: hash of its first prefix_length bytes, hash
+    # of everything and its length
+    prefix = None
+    digest = hashlib.sha256()
+    stream, owned = preprocessor._open_source(source)
+    position = 0
+    try:
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(preprocessor.CHUNK_SIZE), b''):
+            if prefix is None and position + len(chunk) >= prefix_length:
+                prefix = digest.copy()
+                prefix.update(chunk[:prefix_length - position])
+            digest.update(chunk)
+            position += len(chunk)
+        stream.seek(0)
+    finally:
+        if owned:
+            stream.close()
+    return prefix.hexdigest() if prefix else None, digest.hexdigest(), position
+
+def _chat_dir(chat_id, state_dir):
+    return os.path.join(state_dir, chat_id)
+
+def _load_state(chat_id, state_dir):
+    try:
+        with open(os.path.join(_chat_dir(chat_id, state_dir), 'state.json'), encoding='utf-8') as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return state if state.get('version') == STATE_VERSION else None
+
+def _row_hashes(df):
+    rows = pd.DataFrame({
+        'date': df['date'].astype('int64'),
+        'user': df['user'].astype(str),
+        'message': df['message'].astype(str),
+    })
+    return pd.util.hash_pandas_object(rows, index=False).to_numpy()
+
+def _rows_digest(hashes):
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+def aggregate(df):
+    return {
+        'cube': build_cube(df),
+        'terms': features.term_index(df),
+        'emojis': features.emoji_index(df),
+    }
+
+def merge_aggregates(aggregates, delta):
+    return {
+        'cube': merge_cubes(aggregates['cube'], delta['cube']),
+        'terms': aggregates['terms'].add(delta['terms'], fill_value=0).astype('int64'),
+        'emojis': aggregates['emojis'].add(delta['emojis'], fill_value=0).astype('int64'),
+    }
+
+# sentiment is left out: it is scored on first use, see Chat.ensure_polarity,
+# and from then on stored with the chat and scored for new tails only
+def _analyze(df):
+    return features.add_features(df)
+
+# a table goes to a file named after its content and state.json, replaced
+# last, names the files it goes with, so a write cut short leaves the old
+# state with its old tables
+def _write_table(path, name, table):
+    buffer = io.BytesIO()
+    table.to_parquet(buffer, index=False)
+    data = buffer.getvalue()
+    file = f"{name}-{hashlib.sha256(data).hexdigest()[:16]}.parquet"
+    tmp = os.path.join(path, file + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(path, file))
+    return file
+
+def _save(chat_id, state, aggregates, state_dir):
+    path = _chat_dir(chat_id, state_dir)
+    os.makedirs(path, exist_ok=True)
+
+    tables = {'cube': _write_table(path, 'cube', aggregates['cube'])}
+    for name in ('terms', 'emojis'):
+        tables[name] = _write_table(path, name, aggregates[name].reset_index())
+    state = dict(state, tables=tables)
+
+    tmp = os.path.join(path, 'state.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, os.path.join(path, 'state.json'))
+
+    # tables of earlier states
+    for name in os.listdir(path):
+        if name.endswith('.parquet') and name not in tables.values():
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+
+# a damaged table (e.g. truncated) raises ArrowInvalid, a ValueError; the
+# chat is then parsed again in full
+def _load_aggregates(state, state_dir):
+    path = _chat_dir(state['chat_id'], state_dir)
+    tables = state['tables']
+    try:
+        aggregates = {'cube': pd.read_parquet(os.path.join(path, tables['cube']))}
+        for name, key in (('terms', ['user', 'word']), ('emojis', ['user', 'emoji'])):
+            table = pd.read_parquet(os.path.join(path, tables[name]))
+            aggregates[name] = table.set_index(key)['count']
+    except (OSError, ValueError):
+        return None
+
+    # touch the directory so cache eviction sees it as recently used
+    os.utime(path)
+    return aggregates
+
+def _tail(source, state, prefix, length, state_dir, cache_dir):
+    # (frame, aggregates) when the stored chat is the start of this export,
+    # parsing and aggregating only what comes after it; None otherwise
+    old = cache.get(state['key'], cache_dir)
+    aggregates = _load_aggregates(state, state_dir)
+    if old is None or aggregates is None:
+        return None
+
+    if prefix == state['key'] and length > state['length']:
+        # byte level: the old export is literally the start of this one
+        stream, owned = preprocessor._open_source(source)
+        try:
+            stream.seek(state['length'])
+            # a short tail may not settle day/month order, reuse the chat's
+            tail = preprocessor.read_chat(stream, compact=True, fmt=preprocessor.ChatFormat(*state['format']))
+        finally:
+            if owned:
+                stream.close()
+            else:
+                stream.seek(0)
+        if not tail.empty and tail['date'].iloc[0] < old['date'].iloc[-1]:
+            return None
+    else:
+        # message level: same first messages, e.g. after a re-export
+        new = preprocessor.read_chat(source, compact=True)
+        rows = len(old)
+        if len(new) < rows or _rows_digest(_row_hashes(new.iloc[:rows])) != state['rows_hash']:
+            return None
+        tail = new.iloc[rows:].reset_index(drop=True)
+
+    # the tail is scored when the stored chat has been; a frame and cube that
+    # disagree (a write cut short) both drop sentiment to be scored again
+    scored = 'polarity' in old and 'positive' in aggregates['cube']
+    if not scored:
+        old = old.drop(columns='polarity', errors='ignore')
+        aggregates['cube'] = aggregates['cube'].drop(columns=SENTIMENT_TALLIES, errors='ignore')
+
+    if tail.empty:
+        return old, aggregates
+
+    tail = _analyze(tail)
+    if scored:
+        tail = sentiment.add_polarity(tail)
+    df = preprocessor.compact_frame(pd.concat([old, tail], ignore_index=True))
+    return df, merge_aggregates(aggregates, aggregate(tail))
+
+def load_chat(source, state_dir=STATE_DIR, cache_dir=cache.CACHE_DIR):
+    chat_id = _chat_id(source)
+    state = _load_state(chat_id, state_dir)
+
+    prefix_length = state['length'] if state is not None else 0
+    prefix, digest, length = _read_hashes(source, prefix_length)
+
+    if state is not None and state['key'] == digest:
+        df = cache.get(digest, cache_dir)
+        aggregates = _load_aggregates(state, state_dir)
+        if df is not None and aggregates is not None:
+            return digest, df, aggregates
+
+    result = None
+    if state is not None:
+        result = _tail(source, state, prefix, length, state_dir, cache_dir)
+
+    if result is None:
+        fmt = preprocessor.detect_source_format(source)
+        df = _analyze(preprocessor.read_chat(source, compact=True, fmt=fmt))
+        aggregates = aggregate(df)
+    else:
+        df, aggregates = result
+        fmt = preprocessor.ChatFormat(*state['format'])
+
+    state = {
+        'version': STATE_VERSION,
+        'chat_id': chat_id,
+        'key': digest,
+        'length': length,
+        'rows_hash': _rows_digest(_row_hashes(df)),
+        'format': list(fmt),
+    }
+    cache.put(digest, df, cache_dir)
+    _save(chat_id, state, aggregates, state_dir)
+    return digest, df, aggregates
+
+# a persist callback for the chat loaded from source as key: the frame with
+# polarity goes back to the parse cache and the cube with its tallies to the
+# chat's state, unless a newer export of the chat has replaced them since
+def polarity_saver(source, key, state_dir=STATE_DIR, cache_dir=cache.CACHE_DIR):
+    chat_id = _chat_id(source)
+
+    def save(df, cube):
+        state = _load_state(chat_id, state_dir)
+        if state is None or state['key'] != key:
+            return
+        aggregates = _load_aggregates(state, state_dir)
+        if aggregates is None:
+            return
+        aggregates['cube'] = cube
+        cache.put(key, df, cache_dir)
+        _save(chat_id, state, aggregates, state_dir)
+
+    return save
@@ -0,0 +1,172 @@
+import os
+import time
+import uuid
+import multiprocessing
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# heavy analyses run off the Streamlit script thread. Every session submits
+# to the same bounded pools: JOB_WORKERS threads run jobs, and CPU-bound
+# inner work (sentiment batches, figure renders) goes to one shared process
+# pool of CPU_WORKERS instead of a pool per call.
+JOB_WORKERS = int(os.environ.get('CHAT_JOB_WORKERS', 2))
+CPU_WORKERS = int(os.environ.get('CHAT_CPU_WORKERS', os.cpu_count() or 1))
+
+# finished jobs are forgotten after this many seconds
+JOB_TTL = 600
+
+_lock = threading.Lock()
+_jobs = {}
+_by_key = {}
+_job_pool = None
+_cpu_pool = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key, name):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.name = name
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    @property
+    def seconds(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    # progress callback handed to the job's function; it is also where a
+    # cancelled job stops
+    def update(self, done, total, message=''):
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        self.progress = done / total if total else 0.0
+        self.message = message
+
+
+def _pool():
+    global _job_pool
+    if _job_pool is None:
+        _job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='chat-job')
+    return _job_pool
+
+def cpu_pool():
+    global _cpu_pool
+    if CPU_WORKERS <= 1:
+        return None
+    with _lock:
+        if _cpu_pool is None:
+            # spawned, not forked: the server process runs many threads
+            _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _cpu_pool
+
+# func over the items of iterables, as executor.map does, on pool when given
+# (a shared executor used instead of a new one), else on a new process pool
+# of workers, or in this thread with one worker; progress(done, total,
+# message) is called after every result
+def mapped(func, *iterables, workers=1, pool=None, progress=None, message=''):
+    total = len(iterables[0])
+    results = []
+
+    def collect(items):
+        for result in items:
+            results.append(result)
+            if progress is not None:
+                progress(len(results), total, message)
+
+    if workers > 1 and total > 1 and pool is not None:
+        collect(pool.map(func, *iterables))
+    elif workers > 1 and total > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            collect(executor.map(func, *iterables))
+    else:
+        collect(map(func, *iterables))
+    return results
+
+def _run(job, func, args, kwargs):
+    if job._cancel.is_set():
+        job.status = 'cancelled'
+        return
+    job.status = 'running'
+    job.started = time.time()
+    try:
+        result = func(*args, **kwargs)
+        # a function without the progress callback cannot stop part way,
+        # but a cancel that came meanwhile still drops its result
+        if job._cancel.is_set():
+            raise JobCancelled(job.id)
+        job.result = result
+        job.progress = 1.0
+        job.status = 'done'
+    except JobCancelled:
+        job.status = 'cancelled'
+    except Exception:
+        job.error = traceback.format_exc()
+        job.status = 'failed'
+    finally:
+        job.finished = time.time()
+
+def _purge():
+    now = time.time()
+    for job_id, job in list(_jobs.items()):
+        if job.done and now - job.finished > JOB_TTL:
+            del _jobs[job_id]
+            if _by_key.get(job.key) == job_id:
+                del _by_key[job.key]
+
+# the job for key, submitting func(*args, **kwargs) unless there already is
+# one, whatever its state; sessions asking for the same key share it, and a
+# failed or cancelled job stays until it is forgotten. With progress=True
+# the function also gets the job's progress callback as progress=
+def submit(key, name, func, *args, progress=False, **kwargs):
+    with _lock:
+        _purge()
+        job_id = _by_key.get(key)
+        if job_id is not None:
+            return _jobs[job_id]
+
+        job = Job(key, name)
+        _jobs[job.id] = job
+        _by_key[key] = job.id
+        if progress:
+            kwargs['progress'] = job.update
+        job.future = _pool().submit(_run, job, func, args, kwargs)
+    return job
+
+def get(job_id):
+    return _jobs.get(job_id)
+
+def cancel(job_id):
+    job = _jobs.get(job_id)
+    if job is None or job.done:
+        return
+    job._cancel.set()
+    if job.future.cancel():
+        job.status = 'cancelled'
+        job.finished = time.time()
+
+# drop a job, e.g. to retry it or once a result nobody shares was taken
+def forget(key):
+    with _lock:
+        job_id = _by_key.pop(key, None)
+        if job_id is not None:
+            _jobs.pop(job_id, None)
@@ -1,63 +1,275 @@
 import re
+import codecs
+from collections import namedtuple
 import pandas as pd
 
+# timestamp layouts of the supported exports; group 1 is the timestamp text
+# and the time part of its strptime format
+LAYOUTS = {
+    'android_12h': (r'(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s[APap][Mm])\s-\s', '%I:%M %p'),
+    'android_24h': (r'(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2})\s-\s', '%H:%M'),
+    'ios_12h': (r'\[(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}:\d{2}\s[APap][Mm])\]\s', '%I:%M:%S %p'),
+    'ios_24h': (r'\[(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}:\d{2})\]\s', '%H:%M:%S'),
+}
+COMPILED_LAYOUTS = {name: re.compile(pattern) for name, (pattern, _) in LAYOUTS.items()}
+
+# a detected export format: one of LAYOUTS plus the exact strptime format
+ChatFormat = namedtuple('ChatFormat', ['layout', 'date_format'])
+
+DEFAULT_FORMAT = ChatFormat('android_12h', '%d/%m/%Y, %I:%M %p')
+
+# characters of the export looked at to detect its format
+SAMPLE_CHARS = 16384
+
+# WhatsApp writes narrow/no-break spaces inside timestamps in some locales
+SPACES = str.maketrans({'\u202f': ' ', '\u00a0': ' '})
+
+# bytes (or characters) read from the export per step of the streaming parser
+CHUNK_SIZE = 1 << 20
+
+# longest text a timestamp can span, kept while skipping the preamble
+MAX_TIMESTAMP_LEN = 64
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# "hour-next hour" labels, with midnight written as 00
+TIME_PERIODS = [
+    ('00' if hour == 0 else str(hour)) + "-" + ('00' if hour == 23 else str(hour + 1))
+    for hour in range(24)
+]
+
 
 def get_date_range(df):
     start = df['date'].min().strftime("%d %b %Y")
     end = df['date'].max().strftime("%d %b %Y")
     return start, end
 
-def preprocess(data):
-    pattern = r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s[APap][Mm]\s-\s'
+def _date_fields(stamps):
+    return [stamp.split(',')[0].split('/') for stamp in stamps]
 
-    messages = re.split(pattern, data)[1:]
+# the day/month order a field above 12 proves (it can only be the day), or
+# None when every field is 12 or less
+def _proven_order(fields):
+    if any(int(f[0]) > 12 for f in fields):
+        return '%d/%m'
+    if any(int(f[1]) > 12 for f in fields):
+        return '%m/%d'
+    return None
 
-    dates = re.findall(pattern, data)
+def detect_format(sample):
+    counts = {name: len(pattern.findall(sample)) for name, pattern in COMPILED_LAYOUTS.items()}
+    layout = max(counts, key=counts.get)
+    if counts[layout] == 0:
+        return DEFAULT_FORMAT
 
-    df = pd.DataFrame({'user_message': messages, 'message_date': dates})
+    fields = _date_fields(COMPILED_LAYOUTS[layout].findall(sample))
 
-    df['message_date'] = (
-        df['message_date']
-        .str.replace('\u202f', ' ', regex=False)
-        .str.replace(' -', '', regex=False)
-        .str.strip()
-    )
-    df['message_date'] = pd.to_datetime(df['message_date'], format='%d/%m/%Y, %I:%M %p')
+    # failing a proof, the day is the field that changes more often between
+    # consecutive messages
+    order = _proven_order(fields)
+    if order is None:
+        first = [int(f[0]) for f in fields]
+        second = [int(f[1]) for f in fields]
+        first_changes = sum(a != b for a, b in zip(first, first[1:]))
+        second_changes = sum(a != b for a, b in zip(second, second[1:]))
+        order = '%m/%d' if second_changes > first_changes else '%d/%m'
 
-    df.rename(columns={'message_date': 'date'}, inplace=True)
+    year = '%y' if all(len(f[2]) == 2 for f in fields) else '%Y'
+    return ChatFormat(layout, f"{order}/{year}, {LAYOUTS[layout][1]}")
 
-    users = []
-    messages = []
-    for message in df['user_message']:
-        entry = re.split(r'([\w\W]+?):\s', message)
-        if entry[1:]:
-            users.append(entry[1])
-            messages.append(entry[2])
+# fmt with the day/month order the dates in text prove, or None
+def _proven_format(fmt, text):
+    order = _proven_order(_date_fields(COMPILED_LAYOUTS[fmt.layout].findall(text)))
+    if order is None:
+        return None
+    return ChatFormat(fmt.layout, order + fmt.date_format[5:])
+
+# the format of a whole export: detected from its first SAMPLE_CHARS, then,
+# while no date in it has a field above 12, read on until one does so a
+# guessed day/month order never meets a date it cannot parse. The stream is
+# left where it was.
+def detect_source_format(source, chunk_size=CHUNK_SIZE):
+    stream, owned = _open_source(source)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    position = stream.tell()
+    text = ''
+    fmt = None
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            final = not chunk
+            text += chunk if isinstance(chunk, str) else decoder.decode(chunk, final=final)
+
+            if fmt is None:
+                if len(text) < SAMPLE_CHARS and not final:
+                    continue
+                fmt = detect_format(text[:SAMPLE_CHARS])
+
+            proven = _proven_format(fmt, text)
+            if proven is not None:
+                return proven
+            if final:
+                return fmt
+            # a timestamp cut by the chunk boundary is read again next time
+            text = text[-MAX_TIMESTAMP_LEN:]
+    finally:
+        if owned:
+            stream.close()
         else:
-            users.append('group_notification')
-            messages.append(entry[0])
+            stream.seek(position)
+
+def preprocess(data, compact=False, fmt=None):
+    if fmt is None:
+        fmt = detect_format(data[:SAMPLE_CHARS])
+        fmt = _proven_format(fmt, data) or fmt
+
+    messages = []
+    dates = []
+    matches = list(COMPILED_LAYOUTS[fmt.layout].finditer(data))
+    for match, following in zip(matches, matches[1:] + [None]):
+        dates.append(match.group(1))
+        messages.append(data[match.end():following.start() if following else len(data)])
+
+    df = build_frame(messages, dates, fmt)
+    return compact_frame(df) if compact else df
 
-    df['user'] = users
-    df['message'] = messages
+def build_frame(messages, dates, fmt=DEFAULT_FORMAT):
+    df = pd.DataFrame({'user_message': messages, 'message_date': dates}, dtype=str)
+
+    # one exact-format pass, never per-row inference
+    stamps = df['message_date'].str.translate(SPACES)
+    try:
+        df['message_date'] = pd.to_datetime(stamps, format=fmt.date_format)
+    except ValueError:
+        bad = stamps[pd.to_datetime(stamps, format=fmt.date_format, errors='coerce').isna()]
+        raise ValueError(f"timestamp {bad.iloc[0]!r} does not match the export's format "
+                         f"{fmt.date_format!r}") from None
+
+    df.rename(columns={'message_date': 'date'}, inplace=True)
+
+    # user and text in one pass; a message that itself contains ": " still
+    # comes out blank, as it did with the old per-row re.split
+    parts = df['user_message'].str.extract(r'^([\w\W]+?):\s([\w\W]*)')
+    has_user = parts[0].notna()
+    text = parts[1].mask(parts[1].str.contains(r'[\w\W]:\s', na=False), '')
+
+    df['user'] = parts[0].fillna('group_notification')
+    df['message'] = text.where(has_user, df['user_message'])
     df.drop(columns=['user_message'], inplace=True)
 
+    hour = df['date'].dt.hour
     df['only_date'] = df['date'].dt.date
     df['year'] = df['date'].dt.year
     df['month_num'] = df['date'].dt.month
-    df['month'] = df['date'].dt.month_name()
+    df['month'] = pd.Categorical.from_codes(df['month_num'] - 1, categories=MONTHS)
     df['day'] = df['date'].dt.day
-    df['day_name'] = df['date'].dt.day_name()
-    df['hour'] = df['date'].dt.hour
+    df['day_name'] = pd.Categorical.from_codes(df['date'].dt.dayofweek, categories=DAYS)
+    df['hour'] = hour
     df['minute'] = df['date'].dt.minute
+    df['time_period'] = pd.Categorical.from_codes(hour, categories=TIME_PERIODS)
+    return df
 
-    time_period = []
-    for hour in df[['day_name', 'hour']]['hour']:
-        if hour == 23:
-            time_period.append(str(hour) + "-" + str('00'))
-        elif hour == 0:
-            time_period.append(str('00') + "-" + str(hour + 1))
-        else:
-            time_period.append(str(hour) + "-" + str(hour + 1))
+# streaming parser for exports too big to hold in memory as one string
+def _open_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        raise TypeError("pass a file path or stream, not the raw export bytes")
+    if hasattr(source, 'read'):
+        return source, False
+    return open(source, 'rb'), True
+
+def preprocess_stream(source, chunk_size=CHUNK_SIZE, fmt=None):
+    stream, owned = _open_source(source)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+
+    if fmt is None and stream.seekable():
+        fmt = detect_source_format(stream, chunk_size)
+    pattern = COMPILED_LAYOUTS[fmt.layout] if fmt is not None else None
+    buffer = ''
+    started = False
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            final = not chunk
+            if isinstance(chunk, str):
+                buffer += chunk
+            else:
+                buffer += decoder.decode(chunk, final=final)
 
-    df['time_period'] = time_period
+            # detect the format once enough of the export has been read; a
+            # stream that cannot seek back only gets the sample looked at
+            if pattern is None:
+                if len(buffer) < SAMPLE_CHARS and not final:
+                    continue
+                fmt = detect_format(buffer[:SAMPLE_CHARS])
+                pattern = COMPILED_LAYOUTS[fmt.layout]
+
+            matches = list(pattern.finditer(buffer))
+            if not matches:
+                # nothing before the first timestamp belongs to a message
+                if not started:
+                    buffer = buffer[-MAX_TIMESTAMP_LEN:]
+                if final:
+                    break
+                continue
+            started = True
+
+            # the last message may continue in the next chunk, keep it buffered
+            complete = matches if final else matches[:-1]
+            messages = []
+            dates = []
+            for i, match in enumerate(complete):
+                end = matches[i + 1].start() if i + 1 < len(matches) else len(buffer)
+                dates.append(match.group(1))
+                messages.append(buffer[match.end():end])
+
+            if messages:
+                yield build_frame(messages, dates, fmt)
+
+            if final:
+                break
+            buffer = buffer[matches[-1].start():]
+    finally:
+        if owned:
+            stream.close()
+
+def read_chat(source, chunk_size=CHUNK_SIZE, compact=False, fmt=None):
+    batches = list(preprocess_stream(source, chunk_size, fmt))
+    if not batches:
+        df = build_frame([], [])
+    else:
+        df = pd.concat(batches, ignore_index=True)
+    return compact_frame(df) if compact else df
+
+# compact schema: categoricals for repeated strings, small ints for calendar
+# fields and day-resolution datetime64 instead of datetime.date objects
+COMPACT_DTYPES = {
+    'user': 'category',
+    'month': 'category',
+    'day_name': 'category',
+    'time_period': 'category',
+    'year': 'int16',
+    'month_num': 'int8',
+    'day': 'int8',
+    'hour': 'int8',
+    'minute': 'int8',
+}
+
+def compact_frame(df):
+    df = df.astype({col: dtype for col, dtype in COMPACT_DTYPES.items() if col in df})
+    df['only_date'] = df['date'].dt.normalize()
     return df
+
+def memory_report(df, compact_df=None):
+    if compact_df is None:
+        compact_df = compact_frame(df)
+
+    report = pd.DataFrame({
+        'original': df.memory_usage(index=False, deep=True),
+        'compact': compact_df.memory_usage(index=False, deep=True),
+    })
+    report.loc['total'] = report.sum()
+    report['saved'] = report['original'] - report['compact']
+    report['ratio'] = round(report['original'] / report['compact'], 2)
+    return report
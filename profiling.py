@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text file the dashboard rewrites after every render, for a
+# node_exporter textfile collector; unset to skip it
+METRICS_FILE = os.environ.get('CHAT_METRICS_FILE')
+
+METRICS = [
+    ('seconds', 'chat_stage_seconds', "Wall time of a dashboard stage in seconds"),
+    ('peak_bytes', 'chat_stage_peak_bytes', "Peak Python memory allocated during a dashboard stage"),
+    ('rows', 'chat_stage_rows', "Rows produced by a dashboard stage"),
+]
+
+
+# trace memory all the time, not only while a panel is open
+TRACE_ALWAYS = os.environ.get('CHAT_TRACE_MEMORY') == '1'
+
+# Streamlit does not say when a tab closes, so a session that has not asked
+# for tracing for this long no longer counts
+TRACE_TIMEOUT = 3600
+
+_lock = threading.Lock()
+_tracers = {}  # session id -> last time it asked for tracing
+
+# stages measuring a peak run one at a time: the peak is process-wide
+_peak_lock = threading.Lock()
+
+
+# peak memory is only measured while tracemalloc runs, which slows every
+# allocation down. tracemalloc is process-wide, so it runs while any
+# session has its panel open; one session closing its panel never stops
+# tracing under another's stages
+def trace_memory(session, enabled):
+    with _lock:
+        now = time.time()
+        if enabled:
+            _tracers[session] = now
+        else:
+            _tracers.pop(session, None)
+        for other, seen in list(_tracers.items()):
+            if now - seen > TRACE_TIMEOUT:
+                del _tracers[other]
+
+        wanted = TRACE_ALWAYS or bool(_tracers)
+        if wanted and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not wanted and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+def _rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    return None
+
+
+# wall time, peak memory and output rows of each stage of one render
+class Profiler:
+    def __init__(self):
+        self.records = []
+
+    @contextmanager
+    def stage(self, name):
+        record = {'stage': name, 'seconds': None, 'peak_bytes': None, 'rows': None}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            _peak_lock.acquire()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if tracing:
+                if tracemalloc.is_tracing():
+                    record['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base
+                _peak_lock.release()
+            self.records.append(record)
+
+    def call(self, name, func, *args, **kwargs):
+        with self.stage(name) as record:
+            result = func(*args, **kwargs)
+            record['rows'] = _rows(result)
+        return result
+
+    # timings measured elsewhere, e.g. the PDF report's figure renders
+    def add(self, name, seconds):
+        self.records.append({'stage': name, 'seconds': seconds, 'peak_bytes': None, 'rows': None})
+
+    def frame(self):
+        columns = ['stage', 'seconds', 'peak_bytes', 'rows']
+        return pd.DataFrame(self.records, columns=columns).astype({'peak_bytes': 'Int64', 'rows': 'Int64'})
+
+    def log(self, **labels):
+        for record in self.records:
+            logger.info(json.dumps({**labels, **record}))
+
+    def prometheus(self, **labels):
+        lines = []
+        for key, metric, description in METRICS:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} gauge")
+            for record in self.records:
+                if record[key] is None:
+                    continue
+                tags = {**labels, 'stage': record['stage']}
+                text = ','.join(f'{k}="{_escape(v)}"' for k, v in tags.items())
+                lines.append(f"{metric}{{{text}}} {record[key]}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, **labels):
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus(**labels))
+        os.replace(tmp, path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,197 @@
+import threading
+import numpy as np
+import pandas as pd
+import features
+import sentiment
+from cube import build_cube
+from sessions import SESSION_GAP, sessionize
+
+DAY = np.timedelta64(1, 'D')
+
+
+# row positions of each user in a frame, in row order
+def _positions(users):
+    return users.groupby(users, observed=True, sort=False).indices
+
+# rows of a date-sorted frame between two dates (inclusive) and, unless
+# 'Overall', of one user: a binary search for the dates, then a binary
+# search inside the user's own row positions
+def _slice(frame, dates, positions, user, start, end):
+    lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'D'), side='left')
+    hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'D') + DAY, side='left')
+
+    if user == 'Overall':
+        return frame.iloc[lo:hi]
+
+    rows = positions.get(user)
+    if rows is None:
+        return frame.iloc[:0]
+    return frame.take(rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)])
+
+
+# a parsed chat kept sorted by timestamp together with its aggregates; the
+# cube, terms and emoji indexes are built on first use when not given. key
+# is the chat's content hash, it names results cached across renders.
+# persist(df, cube), when given, is called once polarity has been scored so
+# it can be stored with the chat.
+class Chat:
+    # False for a chat opened from a snapshot, which has aggregates only
+    has_rows = True
+    persist = None
+    _nbytes = None
+
+    def __init__(self, df, aggregates=None, key=None, persist=None):
+        self.key = key
+        self.persist = persist
+        if not df['date'].is_monotonic_increasing:
+            df = df.sort_values('date', kind='stable', ignore_index=True)
+        self.df = df
+        self._dates = df['date'].to_numpy()
+        self._users = _positions(df['user'])
+
+        self._aggregates = dict(aggregates or {})
+        self._cube = None
+        self._sessions = None
+        self._lock = threading.Lock()
+
+    @property
+    def min_date(self):
+        return pd.Timestamp(self._dates[0]).date()
+
+    @property
+    def max_date(self):
+        return pd.Timestamp(self._dates[-1]).date()
+
+    def aggregate(self, name):
+        if name not in self._aggregates:
+            if name == 'cube':
+                self._aggregates[name] = build_cube(self.df)
+            elif name == 'terms':
+                self._aggregates[name] = features.term_index(self.df)
+            else:
+                self._aggregates[name] = features.emoji_index(self.df)
+        return self._aggregates[name]
+
+    def cube(self):
+        if self._cube is None:
+            cube = self.aggregate('cube')
+            cube = cube.sort_values('only_date', kind='stable', ignore_index=True)
+            self._cube = (cube, cube['only_date'].to_numpy(), _positions(cube['user']))
+            self._measure()
+        return self._cube
+
+    # polarity is scored on first use, for the whole chat at once, and its
+    # tallies folded into the cube, so every range and user reads them there
+    # afterwards. Two jobs asking at the same time score once.
+    def ensure_polarity(self, workers=None, progress=None, pool=None):
+        if 'positive' in self.aggregate('cube'):
+            return
+        with self._lock:
+            if 'positive' in self.aggregate('cube'):
+                return
+            df = sentiment.ensure_polarity(self.df, workers, progress, pool)
+            cube = build_cube(df)
+            self.df = df
+            self._aggregates['cube'] = cube
+            self._cube = None
+            self._measure()
+            if self.persist is not None:
+                self.persist(df, cube)
+
+    # only the default gap's sessions are kept, other gaps are per query
+    def sessions(self, gap=SESSION_GAP):
+        if gap != SESSION_GAP:
+            return sessionize(self.df, gap)
+        if self._sessions is None:
+            self._sessions = sessionize(self.df, gap)
+            self._measure()
+        return self._sessions
+
+    # memory held by the frame, the default sessions, the sorted cube and
+    # the aggregates built so far; measured again whenever one of them is
+    # added, as the store reads it to enforce its ceiling
+    def _measure(self):
+        total = 0
+        frames = [self.df, self._sessions, self._cube[0] if self._cube is not None else None]
+        for frame in frames + list(self._aggregates.values()):
+            if frame is not None:
+                usage = frame.memory_usage(deep=True)
+                total += int(usage.sum() if isinstance(frame, pd.DataFrame) else usage)
+        self._nbytes = total
+        return total
+
+    def nbytes(self):
+        if self._nbytes is None:
+            return self._measure()
+        return self._nbytes
+
+    def query(self, user='Overall', start=None, end=None):
+        return Query(self, user, start, end)
+
+
+# one user (or 'Overall') over a date range of a chat; what the helper
+# functions take. Slices are computed once per query and shared.
+class Query:
+    def __init__(self, chat, user='Overall', start=None, end=None):
+        self.chat = chat
+        self.user = user
+        self.start = start
+        self.end = end
+        self._memo = {}
+
+    @property
+    def full_range(self):
+        return ((self.start is None or self.start <= self.chat.min_date)
+                and (self.end is None or self.end >= self.chat.max_date))
+
+    # the dates the query covers, clipped to the chat
+    def date_range(self):
+        start = self.chat.min_date if self.start is None else max(self.start, self.chat.min_date)
+        end = self.chat.max_date if self.end is None else min(self.end, self.chat.max_date)
+        return start, end
+
+    def _cached(self, name, build):
+        if name not in self._memo:
+            self._memo[name] = build()
+        return self._memo[name]
+
+    def overall(self):
+        if self.user == 'Overall':
+            return self
+        return self._cached('overall', lambda: Query(self.chat, 'Overall', self.start, self.end))
+
+    def frame(self):
+        chat = self.chat
+        return self._cached('frame', lambda: _slice(
+            chat.df, chat._dates, chat._users, self.user, self.start, self.end))
+
+    def cube(self):
+        cube, dates, positions = self.chat.cube()
+        # by the cube's identity, it is replaced once polarity is folded in
+        return self._cached(('cube', id(cube)), lambda: _slice(
+            cube, dates, positions, self.user, self.start, self.end))
+
+    # users with a message in the date range
+    def users(self):
+        return self.overall().cube()['user'].unique().tolist()
+
+    # (user, word) counts over the range; the stored index when the range
+    # is the whole chat, otherwise counted from the sliced rows. A chat
+    # without rows only has the whole chat's counts.
+    def terms(self):
+        if self.full_range or not self.chat.has_rows:
+            return self.chat.aggregate('terms')
+        return self._cached('terms', lambda: features.term_index(self.frame()))
+
+    def emojis(self):
+        if self.full_range or not self.chat.has_rows:
+            return self.chat.aggregate('emojis')
+        return self._cached('emojis', lambda: features.emoji_index(self.frame()))
+
+    # conversation sessions of everyone in the range; sessions are cut at
+    # the range's edges
+    def sessions(self, gap=SESSION_GAP):
+        if self.full_range and gap == SESSION_GAP:
+            return self.chat.sessions()
+        return self._cached(('sessions', gap), lambda: sessionize(self.overall().frame(), gap))
+
@@ -0,0 +1,109 @@
+import os
+import time
+from io import BytesIO
+import jobs
+
+# figure resolution per report quality tier
+QUALITY_DPI = {
+    'draft': 72,
+    'standard': 120,
+    'high': 200,
+}
+
+
+# figures are described as plain (kind, data, options) specs so they can be
+# rendered in worker processes; Figure objects are drawn with the Agg canvas
+# directly and never touch pyplot's global state. matplotlib, seaborn and
+# reportlab are imported where they are used, not when the app starts
+def _draw(kind, data, options):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=options.get('figsize'))
+    ax = fig.subplots()
+
+    if kind == 'line':
+        ax.plot(data[0], data[1], color=options.get('color'))
+    elif kind == 'bar':
+        ax.bar(data[0], data[1], color=options.get('color'))
+    elif kind == 'barh':
+        ax.barh(data[0], data[1], color=options.get('color'))
+    elif kind == 'pie':
+        ax.pie(data[1], labels=data[0], autopct="%0.1f%%")
+    elif kind == 'heatmap':
+        import seaborn as sns
+        sns.heatmap(data, cmap='YlGnBu', ax=ax)
+    elif kind == 'image':
+        ax.imshow(data)
+        ax.axis("off")
+    else:
+        raise ValueError(f"unknown figure kind: {kind}")
+
+    if 'rotation' in options:
+        ax.tick_params(axis='x', labelrotation=options['rotation'])
+    return fig
+
+def render_png(spec, dpi):
+    start = time.perf_counter()
+    kind, data, options = spec
+    fig = _draw(kind, data, options)
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches="tight", dpi=dpi)
+    return buffer.getvalue(), time.perf_counter() - start
+
+def render_all(specs, dpi, workers=None, progress=None, pool=None):
+    if workers is None:
+        workers = min(len(specs), os.cpu_count() or 1)
+
+    return jobs.mapped(render_png, specs, [dpi] * len(specs), workers=workers, pool=pool,
+                       progress=progress, message="rendering figures")
+
+# sections are ("text", [(style name or "spacer", text or height), ...])
+# or ("figure", title, spec), optionally with a caption after the spec
+def build_pdf(sections, quality='high', workers=None, timings=None, progress=None, pool=None):
+    from reportlab.platypus import SimpleDocTemplate, Image, Paragraph, Spacer
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.utils import ImageReader
+
+    if timings is None:
+        timings = {}
+    dpi = QUALITY_DPI[quality]
+
+    specs = [section[2] for section in sections if section[0] == 'figure']
+    start = time.perf_counter()
+    rendered = iter(render_all(specs, dpi, workers, progress, pool))
+    timings['figures'] = time.perf_counter() - start
+
+    buffer = BytesIO()
+    styles = getSampleStyleSheet()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = []
+
+    for section in sections:
+        if section[0] == 'text':
+            for style, value in section[1]:
+                if style == 'spacer':
+                    story.append(Spacer(1, value))
+                else:
+                    story.append(Paragraph(value, styles[style]))
+            continue
+
+        title = section[1]
+        png, seconds = next(rendered)
+        timings[f"figure: {title}"] = seconds
+
+        iw, ih = ImageReader(BytesIO(png)).getSize()
+        scale = min(1, doc.width / iw)  # only scale down to the page width
+
+        story.append(Paragraph(f"<b>{title}</b>", styles['Heading2']))
+        if len(section) > 3 and section[3]:
+            story.append(Paragraph(section[3], styles['Italic']))
+        story.append(Image(BytesIO(png), width=iw * scale, height=ih * scale))
+        story.append(Spacer(1, 18))
+
+    start = time.perf_counter()
+    doc.build(story)
+    timings['layout'] = time.perf_counter() - start
+
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,64 @@
+import os
+import hashlib
+import jobs
+
+# distinct texts scored per task when scoring across a process pool
+BATCH_SIZE = 5000
+
+# below this many unscored texts a pool costs more than it saves
+PARALLEL_MIN = 20000
+
+MEMO_SIZE = 1_000_000
+
+# polarity by text hash, shared by every chat scored in this process
+_memo = {}
+
+
+def _text_key(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def _score_batch(texts):
+    # textblob pulls in nltk, import it only where texts get scored
+    from textblob import TextBlob
+    return [TextBlob(text).sentiment.polarity for text in texts]
+
+def score_texts(texts, workers=None, progress=None, pool=None):
+    keys = [_text_key(text) for text in texts]
+    scores = {}
+    missing = []
+    for text, key in zip(texts, keys):
+        # one lookup, as jobs on other threads may clear the memo meanwhile
+        score = _memo.get(key)
+        if score is not None:
+            scores[key] = score
+        else:
+            missing.append(text)
+
+    if missing:
+        if workers is None:
+            workers = os.cpu_count() if len(missing) >= PARALLEL_MIN else 1
+
+        batches = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+        results = jobs.mapped(_score_batch, batches, workers=workers, pool=pool,
+                              progress=progress, message="scoring sentiment")
+
+        if len(_memo) + len(missing) > MEMO_SIZE:
+            _memo.clear()
+        for batch, batch_scores in zip(batches, results):
+            for text, score in zip(batch, batch_scores):
+                key = _text_key(text)
+                scores[key] = _memo[key] = score
+
+    return [scores[key] for key in keys]
+
+# polarity per message, each distinct text scored once
+def add_polarity(df, workers=None, progress=None, pool=None):
+    texts = df['message'].unique().tolist()
+    scores = dict(zip(texts, score_texts(texts, workers, progress, pool)))
+    df['polarity'] = df['message'].map(scores).astype('float64')
+    return df
+
+def ensure_polarity(df, workers=None, progress=None, pool=None):
+    if 'polarity' in df:
+        return df
+    return add_polarity(df.copy(), workers, progress, pool)
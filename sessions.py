@@ -0,0 +1,50 @@
+import pandas as pd
+
+# a conversation ends after this long without messages
+SESSION_GAP = pd.Timedelta(hours=1)
+
+
+# conversation sessions of a date-sorted chat, one row per message (group
+# notifications left out): its session number, whether it starts a
+# session, and for a reply (a message from someone else than the previous
+# sender, in the same session) who it answers and after how many seconds.
+# Only diff/shift/cumsum, so linear in the number of messages.
+def sessionize(df, gap=SESSION_GAP):
+    df = df[df['user'] != 'group_notification']
+    if not df['date'].is_monotonic_increasing:
+        df = df.sort_values('date', kind='stable')
+
+    since = df['date'].diff()
+    starts = since.isna() | (since > gap)
+    previous = df['user'].shift()
+    reply = ~starts & (df['user'] != previous)
+
+    return pd.DataFrame({
+        'date': df['date'],
+        'user': df['user'],
+        'session': starts.cumsum().astype('int64') - 1,
+        'starts': starts,
+        'replied_to': previous.where(reply),
+        'response_secs': since.dt.total_seconds().where(reply),
+    }, index=df.index)
+
+# one row per session: when it started and ended, who started it, how many
+# messages and participants it had
+def session_table(sessions):
+    grouped = sessions.groupby('session')
+    table = grouped.agg(start=('date', 'first'), end=('date', 'last'), messages=('date', 'size'))
+    table['starter'] = sessions.loc[sessions['starts'], 'user'].to_numpy()
+    table['participants'] = sessions.drop_duplicates(['session', 'user']).groupby('session').size()
+    table['minutes'] = (table['end'] - table['start']).dt.total_seconds() / 60
+    return table
+
+# median seconds each user takes to answer
+def response_times(sessions):
+    times = sessions.groupby('user', observed=True)['response_secs'].median()
+    return times.dropna().sort_values()
+
+# replies counted by (who replied, to whom), as a matrix
+def reply_matrix(sessions):
+    replies = sessions[sessions['replied_to'].notna()]
+    counts = replies.groupby(['user', 'replied_to'], observed=True).size()
+    return counts.unstack(fill_value=0)
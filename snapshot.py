@@ -0,0 +1,146 @@
+import io
+import os
+import json
+import zipfile
+import pandas as pd
+import helper
+from query import Chat
+
+# a chat's analysis without its messages, to move between machines and
+# reopen without the export: Parquet tables of the aggregate cube and the
+# per-user word and emoji counts, plus a JSON manifest with the sentiment
+# tallies and personality tags. Written as a directory, or as a zip of the
+# same files for a path ending in .zip or a file object.
+SNAPSHOT_FORMAT = 'whatsapp-chat-snapshot'
+
+# bump when a table or the manifest changes shape; older versions are
+# still read as long as their tables can be
+SNAPSHOT_VERSION = 1
+
+MANIFEST = 'manifest.json'
+
+# table name -> index columns stored as plain columns
+TABLES = {
+    'cube': None,
+    'terms': ['user', 'word'],
+    'emojis': ['user', 'emoji'],
+}
+
+
+# a chat opened from a snapshot: every aggregate-backed view works, rows
+# and conversation sessions do not exist
+class Snapshot(Chat):
+    has_rows = False
+
+    def __init__(self, manifest, aggregates, key=None):
+        self.key = key
+        self.manifest = manifest
+        self.df = None
+        self._users = {}
+        self._aggregates = dict(aggregates)
+        self._cube = None
+        self._sessions = None
+        self._dates = self.cube()[1]
+
+    def sessions(self, gap=None):
+        raise ValueError("a chat snapshot holds no messages to build sessions from")
+
+
+def _manifest(chat, tables):
+    q = chat.query()
+    if chat.has_rows:
+        personality = helper.user_personality(q)
+    else:
+        personality = chat.manifest['personality']
+
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'source': chat.key,
+        'start': chat.min_date.isoformat(),
+        'end': chat.max_date.isoformat(),
+        'messages': int(chat.aggregate('cube')['messages'].sum()),
+        'users': sorted(str(user) for user in q.users() if user != 'group_notification'),
+        'sentiment': helper.sentiment_analysis(q),
+        'personality': personality,
+        'tables': tables,
+    }
+
+# (file name, bytes) of every file of the snapshot, manifest last
+def _files(chat):
+    # sentiment tallies are part of the cube table
+    chat.ensure_polarity()
+    files = []
+    tables = {}
+    for name, index in TABLES.items():
+        table = chat.aggregate(name)
+        if index is not None:
+            table = table.rename('count').reset_index()
+        buffer = io.BytesIO()
+        table.to_parquet(buffer, index=False)
+        tables[name] = {'file': f"{name}.parquet", 'rows': len(table)}
+        files.append((tables[name]['file'], buffer.getvalue()))
+
+    manifest = _manifest(chat, tables)
+    files.append((MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')))
+    return files
+
+def write_snapshot(chat, target):
+    files = _files(chat)
+    if isinstance(target, (str, os.PathLike)) and not str(target).endswith('.zip'):
+        os.makedirs(target, exist_ok=True)
+        for name, data in files:
+            tmp = os.path.join(target, name + '.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(target, name))
+        return
+
+    # Parquet is compressed already
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _load(read):
+    try:
+        manifest = json.loads(read(MANIFEST))
+    except (KeyError, FileNotFoundError):
+        raise ValueError("not a chat snapshot: it has no manifest") from None
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError("not a chat snapshot")
+    if manifest.get('version', 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"snapshot version {manifest['version']} is newer than this "
+                         f"version of the analyzer reads ({SNAPSHOT_VERSION})")
+
+    aggregates = {}
+    for name, index in TABLES.items():
+        table = pd.read_parquet(io.BytesIO(read(manifest['tables'][name]['file'])))
+        aggregates[name] = table if index is None else table.set_index(index)['count']
+    return manifest, aggregates
+
+# (manifest, aggregates) of a snapshot directory, zip file or file object
+def read_snapshot(source):
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        return _load(lambda name: _read_file(os.path.join(source, name)))
+    with zipfile.ZipFile(source) as archive:
+        return _load(archive.read)
+
+def open_snapshot(source, key=None):
+    manifest, aggregates = read_snapshot(source)
+    return Snapshot(manifest, aggregates, key)
+
+# whether an uploaded file is a snapshot zip rather than an export (which
+# may be a zip too, holding the chat's text and media)
+def is_snapshot(source):
+    try:
+        with zipfile.ZipFile(source) as archive:
+            return MANIFEST in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+    finally:
+        source.seek(0)
@@ -0,0 +1,127 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# parsed chats shared by every session of the server, keyed by content
+# hash: N viewers of one export hold one Chat. The Chat and its frame are
+# read-only to callers. A chat nobody views is evicted after IDLE_SECONDS,
+# and idle chats are evicted least recently used first once the store
+# passes MAX_BYTES; chats being viewed are never evicted.
+MAX_BYTES = int(os.environ.get('CHAT_STORE_MAX_BYTES', 2 * 1024 ** 3))
+IDLE_SECONDS = int(os.environ.get('CHAT_STORE_IDLE_SECONDS', 900))
+
+# Streamlit does not say when a browser tab closes, so a viewer that has
+# not rerun for this long no longer counts
+VIEWER_TIMEOUT = 3600
+
+# eviction also runs this often on its own, for a server nobody uses
+SWEEP_SECONDS = 60
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # least recently used first
+_sweeper = None
+
+
+class _Entry:
+    def __init__(self, chat):
+        self.chat = chat
+        self.viewers = {}
+        self.last_used = time.time()
+
+    # the chat measures itself again as its sessions, cube or polarity
+    # are added, so this follows what it holds now
+    @property
+    def nbytes(self):
+        return self.chat.nbytes()
+
+
+def _evict(now):
+    total = 0
+    for key, entry in list(_entries.items()):
+        entry.viewers = {v: seen for v, seen in entry.viewers.items() if now - seen < VIEWER_TIMEOUT}
+        if not entry.viewers and now - entry.last_used > IDLE_SECONDS:
+            del _entries[key]
+            logger.info("evicted idle chat %s", key)
+        else:
+            total += entry.nbytes
+
+    for key, entry in list(_entries.items()):
+        if total <= MAX_BYTES:
+            break
+        if not entry.viewers:
+            del _entries[key]
+            total -= entry.nbytes
+            logger.info("evicted chat %s, store over %d bytes", key, MAX_BYTES)
+    if total > MAX_BYTES:
+        logger.warning("chat store holds %d bytes of viewed chats, over its %d ceiling", total, MAX_BYTES)
+
+def _sweep():
+    while True:
+        time.sleep(SWEEP_SECONDS)
+        with _lock:
+            _evict(time.time())
+
+# called with the lock held
+def _start_sweeper():
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = threading.Thread(target=_sweep, name='chat-store-sweep', daemon=True)
+        _sweeper.start()
+
+# the shared chat for key, or None when it is not loaded
+def get(key):
+    with _lock:
+        _evict(time.time())
+        entry = _entries.get(key)
+        return entry.chat if entry is not None else None
+
+# add a chat unless one with the same key is already shared, in which case
+# that one is returned and the given copy can be dropped; viewer, if given,
+# holds it from the start so it cannot be evicted before first use
+def put(key, chat, viewer=None):
+    # sizing a large frame takes a while, do it outside the lock
+    if get(key) is None:
+        chat.nbytes()
+    with _lock:
+        _start_sweeper()
+        entry = _entries.get(key)
+        if entry is None:
+            entry = _entries[key] = _Entry(chat)
+        entry.last_used = time.time()
+        if viewer is not None:
+            entry.viewers[viewer] = entry.last_used
+        _entries.move_to_end(key)
+        _evict(entry.last_used)
+        return entry.chat
+
+# the chat for key, counting viewer as one of its holders (a session id);
+# called on every rerun, which keeps the viewer alive
+def acquire(key, viewer):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        entry.viewers[viewer] = now
+        entry.last_used = now
+        _entries.move_to_end(key)
+        _evict(now)
+        return entry.chat
+
+def release(key, viewer):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            entry.viewers.pop(viewer, None)
+            entry.last_used = time.time()
+        _evict(time.time())
+
+def stats():
+    with _lock:
+        return [{'key': key, 'bytes': entry.nbytes, 'viewers': len(entry.viewers),
+                 'idle_secs': round(time.time() - entry.last_used, 1)}
+                for key, entry in _entries.items()]
@@ -0,0 +1,118 @@
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+# synthetic WhatsApp exports for benchmarking:
+#   python synthetic.py chat.txt -n 1000000 --users 12 --locale ios_24h
+
+# timestamp text per locale, as the exports write it; every layout the
+# parser detects is covered, with both day/month orders
+LOCALES = {
+    'android_12h': ('%d/%m/%Y, %I:%M %p', '{} - '),
+    'android_12h_us': ('%m/%d/%y, %I:%M %p', '{} - '),
+    'android_24h': ('%d/%m/%y, %H:%M', '{} - '),
+    'ios_12h': ('%m/%d/%y, %I:%M:%S %p', '[{}] '),
+    'ios_24h': ('%d/%m/%Y, %H:%M:%S', '[{}] '),
+}
+
+WORDS = (
+    "hi hello ok okay yes no haan nahi kal aaj abhi kya kaise theek acha bhai yaar "
+    "meeting lunch dinner movie office home call later tomorrow today tonight work "
+    "please thanks sorry sure done great nice cool lol wait coming going reached "
+    "where when why what how time plan trip photo video send check good bad happy"
+).split()
+
+EMOJIS = ['😂', '❤️', '👍', '🙏', '😭', '😊', '🔥', '👍🏽', '🎉', '😅']
+
+MEDIA_MESSAGE = '<Media omitted>'
+
+# distinct message bodies drawn from; real chats repeat short texts a lot,
+# which the per-text caches (links, emoji, sentiment) rely on
+PHRASES = 20000
+
+BATCH = 100_000
+
+
+def _phrases(rng, emoji_rate, link_rate):
+    lengths = rng.integers(1, 16, PHRASES)
+    words = np.array(WORDS, dtype=object)
+    phrases = []
+    for length in lengths:
+        text = ' '.join(words[rng.integers(0, len(words), length)])
+        if rng.random() < emoji_rate:
+            text += ' ' + ''.join(rng.choice(EMOJIS, rng.integers(1, 4)))
+        if rng.random() < link_rate:
+            text += f" https://example.com/{rng.integers(0, 1_000_000)}"
+        phrases.append(text)
+    return np.array(phrases, dtype=object)
+
+def _batch(rng, size, start, seconds, users, phrases, locale, media_rate, multiline_rate):
+    fmt, wrap = LOCALES[locale]
+    offsets = np.sort(rng.integers(0, seconds, size))
+    dates = pd.Series(start + pd.to_timedelta(offsets, unit='s'))
+    stamps = dates.dt.strftime(fmt)
+    if locale.startswith('android_12h'):
+        stamps = stamps.str.lower()
+    prefix, suffix = wrap.split('{}')
+
+    bodies = pd.Series(phrases[rng.integers(0, len(phrases), size)])
+    bodies = bodies.mask(rng.random(size) < media_rate, MEDIA_MESSAGE)
+    second_line = pd.Series(phrases[rng.integers(0, len(phrases), size)])
+    multiline = rng.random(size) < multiline_rate
+    bodies[multiline] = bodies[multiline] + '\n' + second_line[multiline]
+
+    names = pd.Series(users[rng.integers(0, len(users), size)])
+    lines = prefix + stamps + suffix + names + ': ' + bodies
+    return '\n'.join(lines) + '\n'
+
+def generate_batches(messages, users=8, emoji_rate=0.2, link_rate=0.02, media_rate=0.05,
+                     multiline_rate=0.05, locale='android_12h', days=730, seed=0):
+    if locale not in LOCALES:
+        raise ValueError(f"unknown locale: {locale}")
+    rng = np.random.default_rng(seed)
+    names = np.array([f"User {i + 1}" for i in range(users)], dtype=object)
+    phrases = _phrases(rng, emoji_rate, link_rate)
+
+    start = pd.Timestamp('2020-01-01')
+    seconds = days * 86400
+    # each batch covers its share of the span, so timestamps stay ordered
+    for first in range(0, messages, BATCH):
+        size = min(BATCH, messages - first)
+        batch_start = start + pd.Timedelta(seconds=seconds * first // messages)
+        span = max(seconds * size // messages, 1)
+        yield _batch(rng, size, batch_start, span, names, phrases, locale,
+                     media_rate, multiline_rate)
+
+def generate(messages, **options):
+    return ''.join(generate_batches(messages, **options))
+
+def write_chat(path, messages, **options):
+    with open(path, 'w', encoding='utf-8') as f:
+        for text in generate_batches(messages, **options):
+            f.write(text)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic WhatsApp chat export.")
+    parser.add_argument('output', help="path of the .txt export to write")
+    parser.add_argument('-n', '--messages', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--emoji-rate', type=float, default=0.2)
+    parser.add_argument('--link-rate', type=float, default=0.02)
+    parser.add_argument('--media-rate', type=float, default=0.05)
+    parser.add_argument('--multiline-rate', type=float, default=0.05)
+    parser.add_argument('--locale', choices=list(LOCALES), default='android_12h')
+    parser.add_argument('--days', type=int, default=730, help="span of the chat in days")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    write_chat(args.output, args.messages, users=args.users, emoji_rate=args.emoji_rate,
+               link_rate=args.link_rate, media_rate=args.media_rate,
+               multiline_rate=args.multiline_rate, locale=args.locale, days=args.days,
+               seed=args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
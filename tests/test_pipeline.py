@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import subprocess
+import helper
+import incremental
+import preprocessor
+import synthetic
+from query import Chat
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# a small export and the frame the original per-row parser made of it
+GOLDEN_EXPORT = os.path.join(ROOT, 'fixtures', 'golden_chat.txt')
+GOLDEN_FRAME = os.path.join(ROOT, 'fixtures', 'golden_chat.csv')
+
+# what app.py imports before the upload screen draws, and the libraries that
+# must not come with it; they load on first use of the function needing them
+APP_MODULES = ['preprocessor', 'helper', 'report', 'incremental', 'query', 'profiling',
+               'jobs', 'store', 'cache', 'snapshot']
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'wordcloud', 'reportlab', 'textblob', 'nltk',
+                 'emoji', 'urlextract']
+
+# seconds the app modules may add to a cold start on top of streamlit and pandas
+IMPORT_BUDGET = 0.1
+
+IMPORT_SCRIPT = """
+import sys, json, time
+import streamlit, pandas
+start = time.perf_counter()
+import {modules}
+seconds = time.perf_counter() - start
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{'seconds': seconds, 'heavy': heavy}}))
+"""
+
+
+def _load(path, tmp_path):
+    return incremental.load_chat(str(path), str(tmp_path / 'state'), str(tmp_path / 'cache'))
+
+# parsing the fixture export, whole or streamed in chunks that split
+# messages, gives the golden frame value for value
+def test_golden_frame():
+    with open(GOLDEN_EXPORT, encoding='utf-8') as f:
+        text = f.read()
+    with open(GOLDEN_FRAME, encoding='utf-8') as f:
+        expected = f.read()
+
+    assert preprocessor.preprocess(text).to_csv(index=False) == expected
+    assert preprocessor.read_chat(GOLDEN_EXPORT, chunk_size=64).to_csv(index=False) == expected
+
+# a chat without a single emoji or link goes through loading, aggregating
+# and every dashboard helper
+def test_plain_chat(tmp_path):
+    path = tmp_path / 'plain.txt'
+    synthetic.write_chat(str(path), 2000, emoji_rate=0, link_rate=0, seed=1)
+    key, df, aggregates = _load(path, tmp_path)
+    assert len(df) == 2000
+    assert df['emoji_count'].sum() == 0 and df['link_count'].sum() == 0
+
+    chat = Chat(df, aggregates, key)
+    for func in (helper.fetch_stats, helper.most_common_words, helper.create_wordcloud,
+                 helper.emoji_helper, helper.sentiment_analysis, helper.user_personality,
+                 helper.activity_heatmap, helper.timeline):
+        func(chat.query())
+
+# a month-first export whose first SAMPLE_CHARS cannot tell day from month
+def test_late_day_order(tmp_path):
+    path = tmp_path / 'us.txt'
+    lines = [f"3/4/21, 10:{i % 60:02d} AM - Ann: message {i}\n" for i in range(1000)]
+    path.write_text(''.join(lines) + "3/15/21, 9:00 AM - Bob: later\n", encoding='utf-8')
+    assert path.stat().st_size > preprocessor.SAMPLE_CHARS
+
+    _, df, _ = _load(path, tmp_path)
+    dates = df['date'].dt.strftime('%Y-%m-%d')
+    assert (dates.iloc[0], dates.iloc[-1]) == ('2021-03-04', '2021-03-15')
+
+# the app modules, imported in fresh interpreters (best of three), stay
+# within the budget and bring none of the heavy libraries
+def test_import_budget():
+    script = IMPORT_SCRIPT.format(modules=', '.join(APP_MODULES), heavy=HEAVY_MODULES)
+    runs = []
+    for _ in range(3):
+        out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                             check=True, cwd=ROOT)
+        runs.append(json.loads(out.stdout.splitlines()[-1]))
+
+    assert runs[0]['heavy'] == []
+    assert min(run['seconds'] for run in runs) <= IMPORT_BUDGET
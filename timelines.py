@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# resolutions finest first: pandas frequency, days per point and label format.
+# Weeks run Monday to Sunday and are labelled by their Monday.
+RESOLUTIONS = {
+    'day': ('D', 1, '%d %b %Y'),
+    'week': ('W-MON', 7, 'Week of %d %b %Y'),
+    'month': ('MS', 30.44, '%B-%Y'),
+}
+
+# pixels a point needs to be told apart from its neighbours
+MIN_PIXELS = 3
+
+
+# the finest resolution with no more points than width pixels can show
+def pick_resolution(start, end, width, min_pixels=MIN_PIXELS):
+    points = max(width // min_pixels, 1)
+    days = (end - start).days + 1
+    for name, (_, step, _) in RESOLUTIONS.items():
+        if days / step <= points:
+            return name
+    return 'month'
+
+# daily counts (indexed by date, days without messages left out) summed per
+# period of the resolution, empty periods included as zeros
+def resample(counts, resolution):
+    freq = RESOLUTIONS[resolution][0]
+    if resolution == 'day':
+        return counts.asfreq(freq, fill_value=0)
+    return counts.resample(freq, label='left', closed='left').sum()
+
+# positions of at most about `points` values keeping the lowest and highest of
+# each bucket, plus the first and last value, so spikes and gaps survive;
+# one lexsort instead of a loop over buckets
+def minmax_downsample(values, points):
+    n = len(values)
+    buckets = points // 2
+    if n <= points or buckets < 1:
+        return np.arange(n)
+
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((values, bucket))
+    starts = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.r_[0, order[starts], order[ends], n - 1])
+
+# messages over time as (frame of date, message and label, resolution) at
+# the resolution asked for or, with 'auto', the finest one width pixels fit;
+# when that is still more points than pixels, it is downsampled
+def build(counts, width, resolution='auto', min_pixels=MIN_PIXELS):
+    if counts.empty:
+        frame = pd.DataFrame({'date': pd.to_datetime([]), 'message': [], 'label': []})
+        return frame, 'day' if resolution == 'auto' else resolution
+
+    counts = counts.sort_index()
+    if resolution == 'auto':
+        resolution = pick_resolution(counts.index[0], counts.index[-1], width, min_pixels)
+
+    series = resample(counts, resolution)
+    series = series.iloc[minmax_downsample(series.to_numpy(), max(width // min_pixels, 1))]
+
+    frame = pd.DataFrame({'date': series.index, 'message': series.to_numpy()})
+    frame['label'] = frame['date'].dt.strftime(RESOLUTIONS[resolution][2])
+    return frame, resolution